@@ -0,0 +1,125 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+# Cold start benchmark.
+#
+# Runs ChromaPlot in fresh interpreters and reports the import time of
+# chromaplot.main from `python -X importtime`, the modules that take longest
+# to import, and the time from starting the interpreter to the first paint of
+# the MainWindow. Heavy modules that are loaded before the first paint are
+# listed, they should only be imported once a mode is opened.
+#
+#     python benchmarks/startup.py [--runs 5] [--top 15] [--budget SECONDS]
+#
+# With --budget the script exits with status 1 when the median time to the
+# first paint is over the budget or a heavy module was loaded, so it can be
+# run as a check. Set QT_QPA_PLATFORM=offscreen to run it without a display.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the welcome screen should not need
+HEAVY_MODULES = ('numpy', 'matplotlib', 'requests', 'chromaplot.single_mode', 'chromaplot.overlay_mode')
+
+FIRST_PAINT = """
+import sys, time
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from chromaplot.main import global_stylesheet, CURRENT_VERSION
+from chromaplot.main_window import MainWindow
+from PyQt5.QtWidgets import QApplication
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj is window:
+            print('FIRST_PAINT', time.time(), flush=True)
+            print('HEAVY', ','.join(m for m in {heavy!r} if m in sys.modules), flush=True)
+            QTimer.singleShot(0, app.quit)
+            app.removeEventFilter(self)
+        return False
+
+app = QApplication(sys.argv)
+app.setStyleSheet(global_stylesheet)
+first_paint = FirstPaint()
+app.installEventFilter(first_paint)
+window = MainWindow(CURRENT_VERSION)
+window.show()
+QTimer.singleShot(10000, app.quit)
+app.exec_()
+"""
+
+
+def import_times(module='chromaplot.main'):
+    """Returns the self and cumulative import time in ms of every module
+    imported by module, from -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times
+
+
+def first_paint():
+    """Returns the seconds from starting the interpreter to the first paint
+    of the MainWindow, and the heavy modules loaded by then."""
+    script = FIRST_PAINT.format(heavy=HEAVY_MODULES)
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    painted, heavy = None, []
+    for line in result.stdout.splitlines():
+        if line.startswith('FIRST_PAINT'):
+            painted = float(line.split()[1]) - start
+        elif line.startswith('HEAVY'):
+            heavy = [m for m in line[len('HEAVY'):].strip().split(',') if m]
+    if painted is None:
+        raise RuntimeError(f"MainWindow was never painted:\n{result.stderr}")
+    return painted, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start of ChromaPlot.")
+    parser.add_argument('--runs', type=int, default=5, help="number of fresh interpreters to time")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest imports to list")
+    parser.add_argument('--budget', type=float, help="fail when the median first paint takes longer, in seconds")
+    args = parser.parse_args()
+
+    times = import_times()
+    total = times.get('chromaplot.main', (0, 0))[1]
+    print(f"import chromaplot.main: {total:.1f} ms")
+    print("slowest imports, cumulative and self ms:")
+    for name, (self_ms, cumulative_ms) in sorted(times.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_ms:9.1f}  {self_ms:8.1f}  {name}")
+
+    paints = []
+    heavy = set()
+    for i in range(args.runs):
+        painted, loaded = first_paint()
+        paints.append(painted)
+        heavy.update(loaded)
+    median = statistics.median(paints)
+    print(f"first paint of MainWindow: median {median:.3f} s, min {min(paints):.3f} s over {args.runs} runs")
+    if heavy:
+        print(f"heavy modules loaded before the first paint: {', '.join(sorted(heavy))}")
+
+    if args.budget is not None and (median > args.budget or heavy):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
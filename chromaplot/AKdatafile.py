@@ -4,21 +4,163 @@ Authors: Billy Hobbs and Felipe Ossa
 © 2024 Billy Hobbs. All rights reserved.
 '''
 
+import codecs
+import os
+import warnings
+from array import array
+from itertools import repeat
+
+import numpy as np
+
+from chromaplot.chromatogram_data import ChromatogramData
+
+# Byte order marks, longest first so UTF-32 LE is not mistaken for UTF-16 LE
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'UTF-32-LE'),
+    (codecs.BOM_UTF32_BE, 'UTF-32-BE'),
+    (codecs.BOM_UTF8, 'UTF-8'),
+    (codecs.BOM_UTF16_LE, 'UTF-16-LE'),
+    (codecs.BOM_UTF16_BE, 'UTF-16-BE'),
+]
+
+# Code unit of each multibyte encoding, tabs and line breaks are always a
+# single code unit so the raw file can be indexed without decoding it
+UNITS = {
+    'UTF-16-LE': '<u2',
+    'UTF-16-BE': '>u2',
+    'UTF-32-LE': '<u4',
+    'UTF-32-BE': '>u4',
+}
+
+class ColumnBuffer:
+    '''Growable typed buffer for a single column. Numerical chunks are copied
+    into a float64 array with spare room at the end, which is replaced by one
+    half as large again when it fills up, so a column costs little more than
+    8 bytes per value while the file is being read. toarray hands out a view
+    of the filled part, which stays valid when more values are added to a
+    followed file. If text turns up the column is switched over to strings,
+    as a whole column is either numerical or text once parsed. rows counts
+    the lines the values came from'''
+    def __init__ (self):
+        self.values = np.empty(1024)
+        self.size = 0
+        self.text = None
+        self.rows = 0
+
+    def extend (self, column, rows):
+        self.rows += rows
+        if self.text is None and column.dtype.kind == 'f':
+            end = self.size + len(column)
+            if end > len(self.values):
+                values = np.empty(max(end, len(self.values) * 3 // 2))
+                values[:self.size] = self.values[:self.size]
+                self.values = values
+            self.values[self.size:end] = column
+            self.size = end
+            return
+        if self.text is None:
+            # Numbers read before are not turned back into text, which would
+            # not give the cells of the file (0.0 for 0), settext has to be
+            # given them read again as text first
+            self.settext(np.empty(0, dtype=str))
+        self.text.append(column)
+
+    '''Switches the column over to strings, column holding the cells of the
+    rows read so far'''
+    def settext (self, column):
+        self.text = [column]
+        self.values = None
+        self.size = 0
+
+    '''Drops the spare room once no more values will be added'''
+    def trim (self):
+        if self.text is None and len(self.values) > self.size:
+            self.values = self.values[:self.size].copy()
+
+    def toarray (self):
+        if self.text is None:
+            return self.values[:self.size]
+        return np.concatenate(self.text)
+
+
 class AKdatafile:
-    def __init__ (self, datafilename):
+    def __init__ (self, datafilename, chunksize=2**17, cache=None):
         self.datafilename = datafilename
-        self.datalines = []
-        self.colnoerror = []
-        self.colnocheck = []
+        self.chunksize = chunksize
+        self.cache = cache
+        self.colnoerror = array('b')
+        self.colnocheck = array('q')
         self.cc = None
         self.ce = None
-        
+        self.stat = None
+        self.index = None
+
+        self.encoding, self.bom = self.detectencoding()
+
+    '''The cell index is left out when pickled, e.g. to send the data back
+    from a worker process, and is built again if more curves are needed'''
+    def __getstate__ (self):
+        state = dict(self.__dict__)
+        state['index'] = None
+        return state
+
+    '''Works out the encoding from the first few kB of the file so it only
+    has to be decoded once. A byte order mark settles it straight away,
+    without one UTF-16 exports are recognised by their null bytes (high bytes
+    of ASCII characters), which fall on odd offsets for little endian and
+    even offsets for big endian. Anything else is read as UTF-8, or Latin-1
+    if the start of the file is not valid UTF-8. Returns the encoding and the
+    length of the byte order mark to skip'''
+    def detectencoding (self, nbytes=4096):
+        with open(self.datafilename, 'rb') as d:
+            head = d.read(nbytes)
+        for bom, encoding in BOMS:
+            if head.startswith(bom):
+                return encoding, len(bom)
+        if b'\x00' in head:
+            if head[1::2].count(0) >= head[0::2].count(0):
+                return 'UTF-16-LE', 0
+            return 'UTF-16-BE', 0
         try:
-            with open(datafilename, 'r', encoding='UTF-8') as d:
-                self.datalines = d.readlines()
-        except:
-            with open(datafilename, 'r', encoding='UTF-16') as d:
-                self.datalines = d.readlines()
+            head.decode('UTF-8')
+        except UnicodeDecodeError as e:
+            # A multibyte character cut off at the end of the sample is fine
+            if e.start < len(head) - 3:
+                return 'Latin-1', 0
+        return 'UTF-8', 0
+
+    '''Reads the file in blocks of chunksize bytes and decodes them
+    incrementally with the detected encoding, yielding the complete lines of
+    each block without their line endings. Only one block of text is held at
+    a time, the partial line at the end of a block is carried over to the
+    next one. \r\n and \r line endings are treated like \n, as when reading
+    the file in text mode. Reading starts at byte start, which must be the
+    start of a line, and self.offset is kept at the end of the last complete
+    line handed out. With partial=True a last line without a line ending is
+    left unread, as it may still be being written'''
+    def readchunks (self, start=None, partial=False):
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        tail = ''
+        with open(self.datafilename, 'rb') as d:
+            d.seek(self.bom if start is None else start)
+            self.offset = d.tell()
+            while True:
+                block = d.read(self.chunksize)
+                final = not block and not partial
+                text = tail + decoder.decode(block, final=final)
+                cr = ''
+                if not final and text.endswith('\r'):
+                    text, cr = text[:-1], '\r'
+                lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+                if not final:
+                    tail = lines.pop() + cr
+                elif lines[-1] == '':
+                    lines.pop()
+                self.offset = d.tell() - len(decoder.getstate()[0]) - len(tail.encode(self.encoding))
+                if lines:
+                    yield lines
+                if not block:
+                    break
 
     '''Base function, splits each line by tab delimiters and removes \n 
     characters, generates a list word which is used by other functions to parse
@@ -53,52 +195,456 @@ class AKdatafile:
             indict[indictkeys[int(i/2)]] = dict(zip(keys, values))
         return colno, colnoerror
 
-    '''This fills in the initated lists and ignores blank values, note this 
-    code block has issues running properly if UTF16 file format is used 
-    directly not sure why. This will also use try and except to convert all
-    numerical data into floats, hence faciliate plotting with numpy later'''
-    def popcurves(self, inlist, colno, colnoerror, indictkeys, indict):
-        for i in range(colno)[::2]:
-            if inlist[i] == '' and inlist[i+1] == '':
+    '''Splits a block of data lines into columns in one go. When every line
+    has the same number of cells (the usual case for UNICORN exports) the
+    whole block is split at once and the columns are taken as strided slices,
+    otherwise each line is split and padded with blanks so every column still
+    has one cell per row. Rows with an odd number of cells lose the last one,
+    as in readline'''
+    def splitcolumns (self, inlines, colno):
+        nrows = len(inlines)
+        lengths = np.fromiter(map(str.count, inlines, repeat('\t')), dtype=np.intp, count=nrows) + 1
+        colnoerror = lengths % 2 != 0
+        colnocheck = lengths - colnoerror
+        if nrows == 0:
+            columns = [[] for i in range(colno)]
+        elif lengths.min() == lengths.max() and colnocheck[0] >= colno:
+            width = lengths[0]
+            cells = '\t'.join(inlines).split('\t')
+            columns = [cells[i::width] for i in range(colno)]
+        else:
+            words = [line.split('\t') for line in inlines]
+            for i in np.flatnonzero(colnoerror & (lengths <= colno)):
+                words[i].pop()
+            words = [word[:colno] + [''] * (colno - len(word)) for word in words]
+            columns = [*zip(*words)]
+        return columns, colnocheck, colnoerror
+
+    '''Converts a single column, blank cells are dropped and the rest is
+    parsed to a float64 array in bulk by numpy, hence faciliate plotting
+    later. Columns that are not numerical (Fraction, Injection, Logbook...)
+    are kept as string arrays instead, as are all columns with text=True'''
+    def popcolumn (self, cells, text=False):
+        if not text:
+            joined = ' '.join(cells)
+            if not joined.strip():
+                return np.empty(0)
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error', DeprecationWarning)
+                    return np.fromstring(joined, sep=' ')
+            except (ValueError, DeprecationWarning):
                 pass
-            else:
-                entry = indictkeys[int(i/2)]
-                curvekeys = [*indict[entry].keys()]
-                try:
-                    value1 = float(inlist[i]) if inlist[i] else None
-                except ValueError:
-                    value1 = inlist[i] if inlist[i] else None
-                try:
-                    value2 = float(inlist[i+1]) if inlist[i+1] else None
-                except ValueError:
-                    value2 = inlist[i+1] if inlist[i+1] else None
-                
-                if value1 is not None:
-                    indict[entry][curvekeys[0]].append(value1)
-                if value2 is not None:
-                    indict[entry][curvekeys[1]].append(value2)
-        return colno, colnoerror
+        column = np.array(cells, dtype=str)
+        column = np.char.rstrip(column[column != ''])
+        return column[column != '']
+
+    '''This fills in the column buffers for one block of data lines, blank
+    values are ignored. A column that was numerical so far and has text in
+    this block is read again as text from the start of the data'''
+    def popcurves (self, inlines, colno, buffers):
+        columns, colnocheck, colnoerror = self.splitcolumns(inlines, colno)
+        for i in range(colno):
+            buffer = buffers[i]
+            column = self.popcolumn(columns[i], text=buffer.text is not None)
+            if buffer.text is None and column.dtype.kind != 'f' and buffer.size:
+                buffer.settext(self.rereadcolumn(i, colno, buffer.rows))
+            buffer.extend(column, len(inlines))
+        self.colnocheck.frombytes(memoryview(colnocheck.astype(np.int64)).cast('B'))
+        self.colnoerror.frombytes(memoryview(colnoerror.astype(np.int8)).cast('B'))
 
     '''This puts all the code together two argumnets h1 and h2 are taken which
     specifiy the lines with the column headings that form the keys for the 
     dictionary structures, checks in place to make sure that a) column numbers
-    in data are even and b) all lines contain the same number of columns'''
+    in data are even and b) all lines contain the same number of columns.
+    If a DataCache was given, a file that was parsed before is loaded from
+    the cache instead and the text is not parsed at all, the arrays are then
+    memory mapped from the cache'''
     def genAKdict (self, h1, h2):
-        curvelist, odict, cc, ce = self.initodict(*self.readline(self.datalines[h1]))
-        self.colnoerror.append(ce)
-        self.colnocheck.append(cc)
-        cc, ce = self.initidict(*self.readline(self.datalines[h2]), curvelist, odict)
-        self.colnoerror.append(ce)
-        self.colnocheck.append(cc)
-        for line in self.datalines[h2+1:]:
-            cc, ce = self.popcurves(*self.readline(line), curvelist, odict)
-            self.colnoerror.append(ce)
-            self.colnocheck.append(cc)
+        self.h1 = h1
+        self.h2 = h2
+        if self.cache is not None:
+            cached = self.cache.load(self.datafilename, h1, h2)
+            if cached is not None:
+                odict, info = cached
+                if len(odict) == len(info['curves']):
+                    self.cc = info['cc']
+                    self.ce = info['ce']
+                    return {curve: odict[curve] for curve, keys in info['curves']}
+        odict = self.streamAKdict(h1, h2)
         self.cc = self.colnocheck.count(self.colnocheck[0]) == len(self.colnocheck)
         self.ce = all(self.colnoerror)
+        self.storecache(odict, [(curve, [*odict[curve].keys()]) for curve in odict])
         # print([odict.keys()][0])
         # These lines should fix loading in data from the purple akta, but currently cause more problems than they solve
         # uvkey = [x for x in odict.keys() if 'UV' in x] 
         # odict['UV'] = odict[uvkey[0]]
         # del odict[uvkey[0]]
-        return odict
\ No newline at end of file
+        return odict
+
+    '''Streams the file through readchunks, the header lines h1 and h2 set up
+    the dictionaries and everything after h2 is fed into one ColumnBuffer per
+    column, which are handed over as arrays once the whole file is read. With
+    follow=True the buffers are kept for updateAKdict, and a file that does
+    not have all of its header lines yet gives an empty dictionary'''
+    def streamAKdict (self, h1, h2, follow=False):
+        lineno = 0
+        buffers = None
+        for lines in self.readchunks(partial=follow):
+            start = 0
+            if lineno <= h2:
+                start = min(h2 + 1 - lineno, len(lines))
+                if lineno <= h1 < lineno + len(lines):
+                    curvelist, odict, cc, ce = self.initodict(*self.readline(lines[h1 - lineno]))
+                    self.colnoerror.append(ce)
+                    self.colnocheck.append(cc)
+                if lineno <= h2 < lineno + len(lines):
+                    cc, ce = self.initidict(*self.readline(lines[h2 - lineno]), curvelist, odict)
+                    self.colnoerror.append(ce)
+                    self.colnocheck.append(cc)
+                    buffers = [ColumnBuffer() for i in range(cc)]
+            lineno += len(lines)
+            if buffers is not None and start < len(lines):
+                self.popcurves(lines[start:], cc, buffers)
+        if buffers is None:
+            if not follow:
+                raise self.headererror()
+            # updateAKdict starts over once more has been written
+            self.odict, self.curvelist, self.buffers, self.colno = {}, [], None, 0
+            return {}
+        if follow:
+            self.odict, self.curvelist, self.buffers, self.colno = odict, curvelist, buffers, cc
+        else:
+            for buffer in buffers:
+                buffer.trim()
+        self.fillAKdict(odict, curvelist, buffers, cc)
+        return odict
+
+    '''Reads the cells of column i in the first rows data lines again, as
+    text'''
+    def rereadcolumn (self, i, colno, rows):
+        offset = self.offset
+        start = self.h2 + 1
+        lineno = 0
+        cells = []
+        for lines in self.readchunks():
+            first = max(start - lineno, 0)
+            last = min(start + rows - lineno, len(lines))
+            if first < last:
+                cells.extend(self.splitcolumns(lines[first:last], colno)[0][i])
+            lineno += len(lines)
+            if lineno >= start + rows:
+                break
+        # readchunks moves the offset of the pass in progress
+        self.offset = offset
+        return self.popcolumn(cells, text=True)
+
+    '''Hands the contents of the column buffers over to the dictionaries'''
+    def fillAKdict (self, odict, curvelist, buffers, colno):
+        for i in range(colno)[::2]:
+            entry = curvelist[int(i/2)]
+            curvekeys = [*odict[entry].keys()]
+            odict[entry][curvekeys[0]] = buffers[i].toarray()
+            odict[entry][curvekeys[1]] = buffers[i+1].toarray()
+
+    '''Parses a file that is still being written, e.g. exported periodically
+    during a long run, like genAKdict but without the cache. The byte offset
+    of the end of the last complete line and the column buffers are kept, so
+    updateAKdict only has to parse what was added since'''
+    def followAKdict (self, h1, h2):
+        self.h1 = h1
+        self.h2 = h2
+        odict = self.streamAKdict(h1, h2, follow=True)
+        self.cc = not self.colnocheck or self.colnocheck.count(self.colnocheck[0]) == len(self.colnocheck)
+        self.ce = all(self.colnoerror)
+        self.lastbytes = self.readlastbytes()
+        return odict
+
+    '''Appends the lines added to a followed file since followAKdict or the
+    last update to its dictionary, reading from the stored byte offset so the
+    cost is proportional to the new data. A file that got shorter or whose
+    bytes before the offset changed has been replaced, and is parsed again
+    from the start, as is a file that did not have its header lines yet.
+    Returns the number of new data lines'''
+    def updateAKdict (self):
+        size = os.path.getsize(self.datafilename)
+        if size == self.offset:
+            return 0
+        if self.buffers is None or size < self.offset or self.readlastbytes() != self.lastbytes:
+            self.colnoerror = array('b')
+            self.colnocheck = array('q')
+            self.encoding, self.bom = self.detectencoding()
+            self.followAKdict(self.h1, self.h2)
+            return max(len(self.colnocheck) - 2, 0)
+        before = len(self.colnocheck)
+        for lines in self.readchunks(start=self.offset, partial=True):
+            self.popcurves(lines, self.colno, self.buffers)
+        self.cc = self.cc and self.colnocheck[before:].count(self.colnocheck[0]) == len(self.colnocheck) - before
+        self.ce = self.ce and all(self.colnoerror[before:])
+        self.lastbytes = self.readlastbytes()
+        self.fillAKdict(self.odict, self.curvelist, self.buffers, self.colno)
+        return len(self.colnocheck) - before
+
+    '''Reads the bytes just before the stored offset, to recognise a file
+    that has been replaced rather than appended to'''
+    def readlastbytes (self, nbytes=64):
+        with open(self.datafilename, 'rb') as d:
+            d.seek(max(self.offset - nbytes, 0))
+            return d.read(min(self.offset, nbytes))
+
+    '''Lazy counterpart of genAKdict returning a ChromatogramData, only the
+    header lines are read and each curve is converted the first time it is
+    used, so opening a file and listing its curves costs a header scan. The
+    curves named in prefetch are converted straight away, all in one pass.
+    Numerical columns are stored with the given dtype. Curves found in the
+    DataCache are memory mapped from there, and curves converted from the
+    text are added to the cache. The size and mtime of the file are kept, so
+    a curve is not read from a file that was changed or replaced since'''
+    def lazyAKdict (self, h1, h2, prefetch=(), dtype=np.float64):
+        self.h1 = h1
+        self.h2 = h2
+        self.stat = self.readstat()
+        odict = {}
+        if self.cache is not None:
+            cached = self.cache.load(self.datafilename, h1, h2)
+            if cached is not None:
+                odict, info = cached
+                self.cc = info['cc']
+                self.ce = info['ce']
+                if len(odict) == len(info['curves']):
+                    return ChromatogramData.fromdict({curve: odict[curve] for curve, keys in info['curves']}, dtype)
+        data = self.scanheader(h1, h2, dtype)
+        for curve, columns in odict.items():
+            data.setcurve(curve, columns.values())
+        data.load(prefetch)
+        return data
+
+    '''Reads the file up to the header line h2 and sets up an unloaded
+    ChromatogramData, with the pair of columns each curve comes from'''
+    def scanheader (self, h1, h2, dtype=np.float64):
+        lineno = 0
+        for lines in self.readchunks():
+            if lineno <= h1 < lineno + len(lines):
+                curvelist, odict, cc, ce = self.initodict(*self.readline(lines[h1 - lineno]))
+            if lineno <= h2 < lineno + len(lines):
+                cc, ce = self.initidict(*self.readline(lines[h2 - lineno]), curvelist, odict)
+                break
+            lineno += len(lines)
+        else:
+            raise self.headererror()
+        self.colno = cc
+        columns = {}
+        for i in range(cc)[::2]:
+            entry = curvelist[int(i/2)]
+            columns[entry] = (i, i+1)[:len(odict[entry])]
+        return ChromatogramData(odict.keys(), [curve.keys() for curve in odict.values()],
+                                dtype=dtype, source=self, columns=[columns[entry] for entry in odict])
+
+    '''Converts the given columns and returns them as arrays. The cells of
+    the file are indexed on the first call, later calls only read and parse
+    the cells of the wanted columns'''
+    def loadcolumns (self, columns):
+        self.checkstat()
+        if self.index is None:
+            self.index = self.indexcells()
+        return self.readcolumns(columns)
+
+    '''Error for a file that ends before its header lines, e.g. a truncated
+    export or a file that is not an export at all'''
+    def headererror (self):
+        return ValueError(f"The header lines of '{self.datafilename}' are missing, "
+                          f"it does not seem to be an exported data file")
+
+    '''Adds the curves in odict to the DataCache, if there is one. curves
+    lists the name and units of every curve in the file'''
+    def storecache (self, odict, curves):
+        if self.cache is not None:
+            info = {'cc': self.cc, 'ce': self.ce, 'curves': [[curve, [*keys]] for curve, keys in curves]}
+            self.cache.store(self.datafilename, self.h1, self.h2, odict, info)
+
+    '''Size and mtime of the file, to tell when it has been changed'''
+    def readstat (self):
+        st = os.stat(self.datafilename)
+        return st.st_size, st.st_mtime_ns
+
+    '''Raises OSError if the file is no longer the one the header was read
+    from, as its cells would not be where the index says'''
+    def checkstat (self):
+        try:
+            stat = self.readstat()
+        except OSError as e:
+            raise OSError(f"'{self.datafilename}' can no longer be read, load it again: {e}") from e
+        if stat != self.stat:
+            raise OSError(f"'{self.datafilename}' has changed since it was loaded, load it again")
+
+    '''Reads the raw file in blocks of about chunksize bytes, each cut at a
+    line break, and yields each block as an array of code units (bytes for
+    UTF-8 and Latin-1) with the position of its first unit. A block always
+    holds whole lines, a line longer than chunksize makes a longer block'''
+    def readunitblocks (self):
+        unit = np.dtype(UNITS.get(self.encoding, 'u1'))
+        position = 0
+        carry = b''
+        with open(self.datafilename, 'rb') as d:
+            d.seek(self.bom)
+            while True:
+                block = d.read(self.chunksize)
+                raw = carry + block
+                units = np.frombuffer(raw[:len(raw) - len(raw) % unit.itemsize], dtype=unit)
+                if block:
+                    breaks = np.flatnonzero((units == 10) | (units == 13))
+                    # A \r at the very end may be followed by the \n of the next block
+                    if len(breaks) and breaks[-1] == len(units) - 1 and units[-1] == 13:
+                        breaks = breaks[:-1]
+                    if len(breaks) == 0:
+                        carry = raw
+                        continue
+                    units = units[:breaks[-1] + 1]
+                    carry = raw[len(units) * unit.itemsize:]
+                if len(units):
+                    yield position, units
+                    position += len(units)
+                if not block:
+                    break
+
+    '''Finds the cells of every column in one pass over the raw file and
+    returns their start and length in code units, one pair of arrays per
+    column. Blank cells are left out, as popcolumn drops them anyway, and the
+    arrays take the smallest integer type that fits, so the index is a few
+    bytes per value. Only a block of the file is held at a time. Also sets cc
+    and ce from the number of cells of the lines, as genAKdict does'''
+    def indexcells (self):
+        starts = [[] for i in range(self.colno)]
+        lengths = [[] for i in range(self.colno)]
+        lineno = 0
+        self.cc, self.ce = True, True
+        reference = None
+        for position, units in self.readunitblocks():
+            cellstarts, cellends, first, count = self.indexlines(units)
+            lines = np.arange(lineno, lineno + len(count))
+            lineno += len(count)
+            # Rows with an odd number of cells lose the last one, as in readline
+            checked = (lines == self.h1) | (lines >= self.h2)
+            cells = count - count % 2
+            if reference is None and checked.any():
+                reference = cells[checked][0]
+            self.cc = self.cc and bool(np.all(cells[checked] == reference))
+            self.ce = self.ce and bool(np.all(count[checked] % 2 != 0))
+
+            data = lines > self.h2
+            first, cells = first[data], cells[data]
+            for i in range(self.colno):
+                cell = first[i < cells] + i
+                cell = cell[cellends[cell] > cellstarts[cell]]
+                starts[i].append(cellstarts[cell] + position)
+                lengths[i].append(cellends[cell] - cellstarts[cell])
+
+        index = []
+        for i in range(self.colno):
+            columnstarts = np.concatenate(starts[i] or [np.empty(0, dtype=np.intp)])
+            columnlengths = np.concatenate(lengths[i] or [np.empty(0, dtype=np.intp)])
+            index.append((columnstarts.astype(np.min_scalar_type(columnstarts.max(initial=0))),
+                          columnlengths.astype(np.min_scalar_type(columnlengths.max(initial=0)))))
+        return index
+
+    '''Converts the given columns with the index in one pass over the file,
+    reading about chunksize bytes at a time. Like in streamAKdict the cells
+    of each block are parsed into a ColumnBuffer per column, so only the
+    strings of one block are held at a time. A column that was numerical so
+    far and has text in a block is read again as text from the start'''
+    def readcolumns (self, columns):
+        unit = np.dtype(UNITS.get(self.encoding, 'u1'))
+        step = max(self.chunksize // unit.itemsize, 1)
+        cells = []
+        for i in columns:
+            starts, lengths = self.index[i]
+            starts = starts.astype(np.intp)
+            cells.append((starts, starts + lengths))
+        buffers = [ColumnBuffer() for i in columns]
+        done = [0] * len(columns)
+        last = max((starts[-1] for starts, ends in cells if len(starts)), default=-1)
+        with open(self.datafilename, 'rb') as d:
+            for position in range(0, last + 1, step):
+                stop = [int(np.searchsorted(starts, position + step)) for starts, ends in cells]
+                spans = [(starts[lo], ends[hi - 1]) for (starts, ends), lo, hi in zip(cells, done, stop) if hi > lo]
+                if not spans:
+                    continue
+                first = min(start for start, end in spans)
+                units = self.readunits(d, first, max(end for start, end in spans))
+                for k, ((starts, ends), buffer) in enumerate(zip(cells, buffers)):
+                    lo, hi = done[k], stop[k]
+                    if hi == lo:
+                        continue
+                    column = self.popcolumn(self.gathercells(units, starts[lo:hi] - first, ends[lo:hi] - first),
+                                            text=buffer.text is not None)
+                    if buffer.text is None and column.dtype.kind != 'f' and buffer.size:
+                        text = [cell for block in self.blockcells(d, starts[:lo], ends[:lo]) for cell in block]
+                        buffer.settext(self.popcolumn(text, text=True))
+                    buffer.extend(column, hi - lo)
+                    done[k] = hi
+        for buffer in buffers:
+            buffer.trim()
+        return [buffer.toarray() for buffer in buffers]
+
+    '''Yields the cells between starts and ends, which are in file order, as
+    lists of strings, reading about chunksize bytes of the open file d at a
+    time'''
+    def blockcells (self, d, starts, ends):
+        step = max(self.chunksize // np.dtype(UNITS.get(self.encoding, 'u1')).itemsize, 1)
+        i = 0
+        while i < len(starts):
+            j = max(int(np.searchsorted(starts, starts[i] + step)), i + 1)
+            units = self.readunits(d, starts[i], ends[j - 1])
+            yield self.gathercells(units, starts[i:j] - starts[i], ends[i:j] - starts[i])
+            i = j
+
+    '''Reads the code units from start to end of the open file d'''
+    def readunits (self, d, start, end):
+        unit = np.dtype(UNITS.get(self.encoding, 'u1'))
+        d.seek(self.bom + int(start) * unit.itemsize)
+        return np.frombuffer(d.read(int(end - start) * unit.itemsize), dtype=unit)
+
+    '''Finds every cell in a block of code units from the positions of the
+    tabs and line breaks, which are located in bulk by numpy. Returns the
+    start and end of each cell, and for each line the index of its first cell
+    and its number of cells. Line breaks follow readchunks, \r\n counts as
+    one'''
+    def indexlines (self, units):
+        seps = np.flatnonzero(units < 14)
+        codes = units[seps]
+        keep = (codes == 9) | (codes == 10) | (codes == 13)
+        seps, codes = seps[keep], codes[keep]
+        crlf = (codes[:-1] == 13) & (codes[1:] == 10) & (np.diff(seps) == 1)
+        # Cells end at a separator and the next one starts after it, or after
+        # both characters of \r\n
+        width = np.ones(len(seps), dtype=seps.dtype)
+        width[:-1][crlf] = 2
+        keep = np.ones(len(seps), dtype=bool)
+        keep[1:] = ~crlf
+        seps, codes, width = seps[keep], codes[keep], width[keep]
+        if len(seps) == 0 or codes[-1] == 9 or seps[-1] + width[-1] < len(units):
+            # The last line has no line break of its own
+            seps = np.append(seps, len(units))
+            codes = np.append(codes, 10)
+            width = np.append(width, 1)
+        ends = seps
+        starts = np.concatenate(([0], seps[:-1] + width[:-1]))
+        breaks = np.flatnonzero(codes != 9)
+        count = np.diff(np.concatenate(([-1], breaks)))
+        first = breaks - count + 1
+        return starts, ends, first, count
+
+    '''Decodes the cells between starts and ends into a list of strings.
+    The code units of all cells are gathered into one array with a tab after
+    each cell, which is decoded and split in one go'''
+    def gathercells (self, units, starts, ends):
+        if len(starts) == 0:
+            return []
+        lengths = ends - starts + 1
+        offsets = np.cumsum(lengths)
+        index = np.arange(offsets[-1]) + np.repeat(starts - offsets + lengths, lengths)
+        # The slot after the last cell may lie past the end of the file, it is
+        # overwritten with a tab anyway
+        gathered = units[np.minimum(index, len(units) - 1)]
+        gathered[offsets - 1] = 9
+        return gathered.tobytes().decode(self.encoding).split('\t')[:-1]
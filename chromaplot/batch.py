@@ -0,0 +1,260 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import freeze_support
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import numpy as np
+
+from chromaplot.loader import load_file, load_files
+from chromaplot.rendering import SingleRenderer, OverlayRenderer
+from chromaplot.plot_config import (
+    single_config, overlay_config, load_config, render_single, render_overlay, overlay_settings
+)
+from chromaplot.decimation import full_resolution
+
+FORMATS = ('pdf', 'png', 'jpg')
+
+
+def new_figure(config):
+    """A figure of the configured size drawn with Agg, no display needed."""
+    figure = Figure(figsize=tuple(config['figsize']))
+    FigureCanvasAgg(figure)
+    return figure
+
+
+def save_figure(figure, base_name, formats, dpi=None):
+    """Writes figure to base_name with each extension in formats, with every
+    data point as when saving from the GUI. Returns the files written."""
+    written = []
+    with full_resolution(figure):
+        for extension in formats:
+            file_name = f"{base_name}.{extension}"
+            figure.savefig(file_name, dpi=dpi if dpi else 'figure')
+            written.append(file_name)
+    return written
+
+
+def output_base(file_name, output_dir):
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    return os.path.join(output_dir or os.path.dirname(os.path.abspath(file_name)), name)
+
+
+def dataset_names(file_names):
+    """Maps file names to the names of their datasets in an overlay, the
+    base name of the file, or its path below the folders it shares with the
+    files of the same base name."""
+    groups = {}
+    for file_name in file_names:
+        groups.setdefault(os.path.basename(file_name), []).append(file_name)
+
+    names = {}
+    for name, group in groups.items():
+        if len(group) == 1:
+            names[group[0]] = name
+        else:
+            common = os.path.commonpath([os.path.abspath(file_name) for file_name in group])
+            for file_name in group:
+                names[file_name] = os.path.relpath(os.path.abspath(file_name), common)
+    return names
+
+
+def export_single(file_name, config, output_dir=None, formats=('pdf',), dpi=None, timings=None):
+    """Plots one data file with a Single Mode configuration and saves it next
+    to the file, or in output_dir, named after it. Returns the files written,
+    the seconds spent loading, rendering and saving go into timings if given."""
+    start = time.perf_counter()
+    data = load_file(file_name, prefetch=(0, 'Fraction'))
+    loaded = time.perf_counter()
+    figure = new_figure(config)
+    render_single(SingleRenderer(figure), data, config)
+    rendered = time.perf_counter()
+    written = save_figure(figure, output_base(file_name, output_dir), formats, dpi)
+    if timings is not None:
+        timings.update(load=loaded - start, render=rendered - loaded, save=time.perf_counter() - rendered)
+    return written
+
+
+def export_task(file_name, config, output_dir=None, formats=('pdf',), dpi=None):
+    """Runs export_single and returns its manifest entry, also the task run
+    in worker processes. A failure is recorded in the entry, not raised."""
+    entry = {'file': file_name, 'status': 'ok', 'outputs': [], 'error': None, 'seconds': {}}
+    start = time.perf_counter()
+    try:
+        entry['outputs'] = export_single(file_name, config, output_dir, formats, dpi, timings=entry['seconds'])
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['seconds']['total'] = time.perf_counter() - start
+    return entry
+
+
+def export_files(file_names, config, output_dir=None, formats=('pdf',), dpi=None, jobs=None):
+    """Exports every file with export_task, spread over jobs worker
+    processes, one per core by default. Every worker draws on figures of its
+    own, only file names go to the workers and manifest entries come back.
+    With jobs=1 the files are exported one after another in this process.
+    Yields the manifest entries in the order the files finish."""
+    if jobs is None:
+        jobs = min(len(file_names), os.cpu_count() or 1)
+
+    if jobs <= 1:
+        for file_name in file_names:
+            yield export_task(file_name, config, output_dir, formats, dpi)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(export_task, file_name, config, output_dir, formats, dpi) for file_name in file_names]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def export_overlay(file_names, config, base_name, formats=('pdf',), dpi=None):
+    """Overlays the UV of several data files with an Overlay Mode
+    configuration and saves the plot to base_name. Files that cannot be read
+    or have no UV curve are left out and reported as (file_name, error)
+    pairs, if the plot cannot be drawn or saved every file is. Returns the
+    files written and those errors."""
+    file_names = list(dict.fromkeys(file_names))
+    names = dataset_names(file_names)
+    loaded, errors = {}, []
+    for file_name, data, error in load_files(file_names, prefetch=('UV',), dtype=np.float32):
+        if error is None and 'UV' not in data:
+            error = ValueError("No UV curve in the file")
+        if error is not None:
+            errors.append((file_name, error))
+        else:
+            loaded[file_name] = data
+    if not loaded:
+        return [], errors
+
+    # Keep the datasets in the order they were given rather than the order they finished
+    datasets = {names[file_name]: loaded[file_name] for file_name in file_names if file_name in loaded}
+    config = dict(config, datasets=overlay_settings(datasets, config))
+
+    try:
+        figure = new_figure(config)
+        render_overlay(OverlayRenderer(figure), datasets, config)
+        return save_figure(figure, base_name, formats, dpi), errors
+    except Exception as e:
+        return [], errors + [(file_name, e) for file_name in loaded]
+
+
+def write_manifest(file_name, mode, jobs, entries, seconds, outputs=None):
+    """Writes a JSON record of a batch run: one entry per data file with its
+    status, outputs, error and timings, in the order the files were given."""
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'mode': mode,
+        'jobs': jobs,
+        'seconds': seconds,
+        'succeeded': sum(entry['status'] == 'ok' for entry in entries),
+        'failed': sum(entry['status'] != 'ok' for entry in entries),
+        'files': entries
+    }
+    if outputs is not None:
+        manifest['outputs'] = outputs
+    with open(file_name, 'w', encoding='UTF-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m chromaplot.batch',
+        description="Save ChromaPlot figures of Akta data files without opening the GUI."
+    )
+    parser.add_argument('files', nargs='+', help="exported data files to plot")
+    parser.add_argument('-c', '--config', help="plot settings saved with 'Save settings' in Single or Overlay Mode")
+    parser.add_argument('-m', '--mode', choices=('single', 'overlay'),
+                        help="one figure per file or all files overlaid, taken from the settings if not given")
+    parser.add_argument('-o', '--output', help="output directory, by default next to each data file")
+    parser.add_argument('-f', '--format', action='append', choices=FORMATS,
+                        help="file format, may be given more than once (default: pdf)")
+    parser.add_argument('-n', '--name', default='overlay', help="file name of the overlay plot (default: overlay)")
+    parser.add_argument('--dpi', type=float, help="resolution of PNG and JPEG output (default: 100)")
+    parser.add_argument('-j', '--jobs', type=int, help="number of worker processes for single mode (default: one per core)")
+    parser.add_argument('--manifest', help="write a JSON record of the status, outputs and timings of every file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    formats = args.format or ['pdf']
+
+    try:
+        config = load_config(args.config) if args.config else None
+    except (OSError, ValueError) as e:
+        print(f"Error reading settings {args.config}: {e}", file=sys.stderr)
+        return 2
+
+    mode = args.mode or (config['mode'] if config else 'single')
+    if config is None:
+        config = single_config() if mode == 'single' else overlay_config()
+    elif config['mode'] != mode:
+        print(f"Settings in {args.config} are for {config['mode']} mode, not {mode} mode", file=sys.stderr)
+        return 2
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    if mode == 'single':
+        # A file given twice would be written by two workers at once
+        file_names = list(dict.fromkeys(args.files))
+        outputs = {}
+        for file_name in file_names:
+            outputs.setdefault(output_base(file_name, args.output), []).append(file_name)
+        clashes = {base: names for base, names in outputs.items() if len(names) > 1}
+        for base, names in clashes.items():
+            print(f"{', '.join(names)} would all be saved as {base}, "
+                  f"plot them to different output directories", file=sys.stderr)
+        if clashes:
+            return 2
+        jobs = args.jobs if args.jobs else min(len(file_names), os.cpu_count() or 1)
+        entries = {}
+        for entry in export_files(file_names, config, args.output, formats, args.dpi, jobs):
+            entries[entry['file']] = entry
+            if entry['status'] == 'ok':
+                for written in entry['outputs']:
+                    print(written)
+            else:
+                print(f"Error plotting {entry['file']}: {entry['error']}", file=sys.stderr)
+        entries = [entries[file_name] for file_name in file_names]
+        written = None
+    else:
+        jobs = 1
+        base_name = os.path.join(args.output or os.getcwd(), args.name)
+        written, errors = export_overlay(args.files, config, base_name, formats, args.dpi)
+        errors = dict(errors)
+        for file_name, error in errors.items():
+            print(f"Error plotting {file_name}: {error}", file=sys.stderr)
+        for file_name in written:
+            print(file_name)
+        entries = [{
+            'file': file_name,
+            'status': 'failed' if file_name in errors or not written else 'ok',
+            'error': f"{type(errors[file_name]).__name__}: {errors[file_name]}" if file_name in errors else None
+        } for file_name in dict.fromkeys(args.files)]
+    seconds = time.perf_counter() - start
+
+    if args.manifest:
+        write_manifest(args.manifest, mode, jobs, entries, seconds, written)
+
+    return 1 if any(entry['status'] != 'ok' for entry in entries) else 0
+
+
+if __name__ == '__main__':
+    # Needed for the worker processes used to load files in packaged builds
+    freeze_support()
+    sys.exit(main())
@@ -0,0 +1,164 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from chromaplot.data_cache import mapcolumn
+
+
+class ChromatogramData(Mapping):
+    """Columnar container for the curves of one data file.
+
+    Each curve is kept as one contiguous array per column, numerical columns
+    with the given dtype (float32 halves the memory of a dataset) and text
+    columns such as the fraction labels as string arrays. The curve names and
+    the units from the second header line are kept as metadata.
+
+    It reads like the dict of dicts AKdatafile.genAKdict returns, data[curve]
+    gives a CurveView keyed by the units, so data['UV']['mAU'] is the UV
+    trace. Curves can be left unloaded and are then converted by the source
+    AKdatafile the first time they are used. Columns memory mapped from the
+    DataCache are kept as they are, so they only take memory while in use, and
+    are pickled as a reference to the cache entry rather than by value.
+    """
+    __slots__ = ('names', 'units', 'arrays', 'dtype', 'index', 'source', 'columns')
+
+    def __init__(self, names, units, arrays=None, dtype=np.float64, source=None, columns=None):
+        self.names = list(names)
+        self.units = [tuple(keys) for keys in units]
+        self.dtype = np.dtype(dtype)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        if arrays is None:
+            self.arrays = [None] * len(self.names)
+        else:
+            self.arrays = [None if values is None else [self.typed(v) for v in values] for values in arrays]
+        self.source = source
+        self.columns = columns
+
+    @classmethod
+    def fromdict(cls, odict, dtype=np.float64):
+        """Builds a fully loaded container from a dict of dicts."""
+        return cls(odict.keys(), [curve.keys() for curve in odict.values()],
+                   [[np.asanyarray(values) for values in curve.values()] for curve in odict.values()], dtype)
+
+    def typed(self, values):
+        if values.dtype.kind == 'f' and not isinstance(values, np.memmap):
+            return np.ascontiguousarray(values, dtype=self.dtype)
+        return values
+
+    def setcurve(self, name, values):
+        self.arrays[self.index[name]] = [self.typed(v) for v in values]
+
+    def __getstate__(self):
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        state['arrays'] = [None if arrays is None else [
+            ('memmap', v.filename, v.dtype.str, v.offset, len(v)) if isinstance(v, np.memmap) else v
+            for v in arrays] for arrays in self.arrays]
+        return state
+
+    def __setstate__(self, state):
+        state['arrays'] = [None if arrays is None else [
+            mapcolumn(*v[1:]) if isinstance(v, tuple) else v
+            for v in arrays] for arrays in state['arrays']]
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def __getitem__(self, name):
+        return CurveView(self, self.index[name])
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        loaded = sum(arrays is not None for arrays in self.arrays)
+        return f"<ChromatogramData {len(self.names)} curves, {loaded} loaded, {self.nbytes} bytes>"
+
+    def curve(self, name):
+        """Returns the arrays of a curve, one per column, loading it if needed."""
+        i = self.index[name]
+        if self.arrays[i] is None:
+            self.load([name])
+        return self.arrays[i]
+
+    def isloaded(self, name):
+        return self.arrays[self.index[name]] is not None
+
+    def load(self, names=None):
+        """Converts the given curves, or all of them, in one pass over the
+        source file and adds them to its cache. Curves can be given by name
+        or by position, 0 being the first curve of the file. Once every curve
+        is loaded the source is let go."""
+        if self.source is None:
+            return
+        if names is None:
+            names = self.names
+        missing = [name if isinstance(name, int) else self.index.get(name) for name in names]
+        missing = [i for i in dict.fromkeys(missing) if i is not None and i < len(self.names) and self.arrays[i] is None]
+        if not missing:
+            return
+        values = iter(self.source.loadcolumns([column for i in missing for column in self.columns[i]]))
+        loaded = {}
+        for i in missing:
+            # The cache keeps the columns at full precision
+            loaded[self.names[i]] = dict(zip(self.units[i], [next(values) for column in self.columns[i]]))
+            self.arrays[i] = [self.typed(v) for v in loaded[self.names[i]].values()]
+        self.source.storecache(loaded, zip(self.names, self.units))
+
+        if all(arrays is not None for arrays in self.arrays):
+            self.source = None
+            self.columns = None
+
+    @property
+    def nbytes(self):
+        """Memory held by the loaded columns, memory mapped ones are not counted."""
+        return sum(values.nbytes for arrays in self.arrays if arrays is not None
+                   for values in arrays if not isinstance(values, np.memmap))
+
+
+class CurveView(Mapping):
+    """Inner mapping of ChromatogramData, maps the units of a curve to its
+    columns. x and y are the first two columns."""
+    __slots__ = ('data', 'i')
+
+    def __init__(self, data, i):
+        self.data = data
+        self.i = i
+
+    @property
+    def name(self):
+        return self.data.names[self.i]
+
+    @property
+    def units(self):
+        return self.data.units[self.i]
+
+    @property
+    def x(self):
+        return self.data.curve(self.name)[0]
+
+    @property
+    def y(self):
+        return self.data.curve(self.name)[1]
+
+    def __getitem__(self, key):
+        units = self.data.units[self.i]
+        if key not in units:
+            raise KeyError(key)
+        return self.data.curve(self.name)[units.index(key)]
+
+    def __iter__(self):
+        return iter(self.data.units[self.i])
+
+    def __len__(self):
+        return len(self.data.units[self.i])
@@ -0,0 +1,90 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import numpy as np
+
+
+class CurveIndex:
+    """Looks up the value of several curves at the same x in one query.
+
+    The curves are sorted by x once and kept back to back in contiguous
+    float64 arrays. Every curve is shifted along x past the end of the one
+    before it, which makes the shifted x of all curves a single sorted array,
+    so one searchsorted finds the position of a query in every curve at once.
+    The values are then interpolated linearly between the neighbouring points
+    with the same result as np.interp, including holding the first and last
+    value outside a curve. The work arrays are allocated up front, a query
+    costs O(curves * log n).
+    """
+
+    def __init__(self, curves):
+        xs, ys = [], []
+        for x, y in curves:
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+            n = min(len(x), len(y))
+            x, y = x[:n], y[:n]
+            if n and np.any(x[1:] < x[:-1]):
+                order = np.argsort(x, kind='stable')
+                x, y = x[order], y[order]
+            if n == 0:
+                # Nothing to interpolate, always reads as NaN
+                x, y = np.zeros(2), np.full(2, np.nan)
+            elif n == 1:
+                x, y = np.repeat(x, 2), np.repeat(y, 2)
+            xs.append(x)
+            ys.append(y)
+
+        count = len(xs)
+        lengths = np.array([len(x) for x in xs], dtype=np.intp)
+        ends = np.cumsum(lengths)
+        self.first = ends - lengths + 1
+        self.last = ends - 1
+        self.x = np.concatenate(xs) if xs else np.empty(0)
+        self.y = np.concatenate(ys) if ys else np.empty(0)
+
+        lo, hi = (np.nanmin(self.x), np.nanmax(self.x)) if count else (0.0, 0.0)
+        self.shift = np.arange(count) * (hi - lo + 1.0) - lo
+        self.keys = self.x + np.repeat(self.shift, lengths)
+
+        self.query = np.empty(count)
+        self.i0 = np.empty(count, dtype=np.intp)
+        self.x0 = np.empty(count)
+        self.x1 = np.empty(count)
+        self.y0 = np.empty(count)
+        self.y1 = np.empty(count)
+        self.t = np.empty(count)
+        self.mask = np.empty(count, dtype=bool)
+        self.out = np.empty(count)
+
+    def __len__(self):
+        return len(self.out)
+
+    def values(self, x_value):
+        """Returns the value of every curve at x_value, in the order the
+        curves were given. The array is reused by the next query."""
+        np.add(self.shift, x_value, out=self.query)
+        i1 = np.searchsorted(self.keys, self.query, side='right')
+        np.clip(i1, self.first, self.last, out=i1)
+        np.subtract(i1, 1, out=self.i0)
+
+        self.x.take(self.i0, out=self.x0)
+        self.x.take(i1, out=self.x1)
+        self.y.take(self.i0, out=self.y0)
+        self.y.take(i1, out=self.y1)
+
+        # t is the position between the two points, 0 where they coincide
+        np.subtract(self.x1, self.x0, out=self.x1)
+        np.greater(self.x1, 0, out=self.mask)
+        np.subtract(x_value, self.x0, out=self.t)
+        np.multiply(self.t, self.mask, out=self.t)
+        np.divide(self.t, self.x1, out=self.t, where=self.mask)
+        np.clip(self.t, 0.0, 1.0, out=self.t)
+
+        np.subtract(self.y1, self.y0, out=self.out)
+        np.multiply(self.out, self.t, out=self.out)
+        np.add(self.out, self.y0, out=self.out)
+        return self.out
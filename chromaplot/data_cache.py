@@ -0,0 +1,221 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+# Bump whenever the parser output or the entry layout changes so old entries are not reused
+CACHE_VERSION = 3
+
+# Entries start with MAGIC and the length of a JSON header, the columns follow
+# the header, each starting on an ALIGN byte boundary
+MAGIC = b'CHROMAPLOT-CACHE'
+ALIGN = 64
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.chromaplot', 'cache')
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+_default_cache = None
+
+
+def default_cache():
+    """Shared cache used by the GUI, None if caching has been switched off.
+
+    CHROMAPLOT_CACHE_DIR moves the cache and CHROMAPLOT_CACHE_SIZE_MB sets
+    the size cap, a size of 0 disables the cache.
+    """
+    global _default_cache
+    if _default_cache is None:
+        max_mb = os.environ.get('CHROMAPLOT_CACHE_SIZE_MB')
+        max_bytes = int(float(max_mb) * 2**20) if max_mb else DEFAULT_MAX_BYTES
+        if max_bytes <= 0:
+            return None
+        _default_cache = DataCache(os.environ.get('CHROMAPLOT_CACHE_DIR', DEFAULT_CACHE_DIR), max_bytes)
+    return _default_cache
+
+
+def aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def mapcolumn(filename, dtype, offset, count):
+    """Maps one column of a cache entry read-only, its pages are only read
+    from disk when they are used and are shared through the OS page cache."""
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=np.dtype(dtype), mode='r', offset=offset, shape=(count,))
+
+
+class DataCache:
+    """On-disk cache of parsed data files, stored in an aligned binary layout
+    so the columns can be opened with np.memmap instead of being read in.
+
+    Entries are keyed by the content hash of the file. A small key file maps
+    path, size and mtime to that hash, so reopening an unchanged file does not
+    even need to hash it, while a copied or touched file is found again after
+    hashing. An entry may hold only some of the curves of a file, curves
+    stored later are merged into it. Every file is written to a temporary
+    name and moved into place, so several ChromaPlot processes can share one
+    cache directory. When the entries grow past max_bytes, the least recently
+    used ones are removed.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.key_dir = os.path.join(directory, 'keys')
+        self.data_dir = os.path.join(directory, 'data')
+
+    def stat_key(self, path):
+        st = os.stat(path)
+        stat = f"{CACHE_VERSION}|{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(stat.encode('UTF-8')).hexdigest()
+
+    def content_hash(self, path, blocksize=2**20):
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as d:
+            for block in iter(lambda: d.read(blocksize), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def entry_path(self, path, h1, h2):
+        """Path of the data file for path, hashing the file only when the key
+        file for its current size and mtime is missing."""
+        key_file = os.path.join(self.key_dir, self.stat_key(path))
+        try:
+            with open(key_file, 'r') as k:
+                content = k.read().strip()
+        except OSError:
+            content = self.content_hash(path)
+            self._write(key_file, lambda f: f.write(content.encode('UTF-8')))
+        return os.path.join(self.data_dir, f"{content}-{CACHE_VERSION}-{h1}-{h2}.bin")
+
+    def load(self, path, h1, h2):
+        """Returns (odict, info) for a cached file, or None on a miss. odict
+        holds the stored curves with memory mapped columns, info['curves']
+        lists the name and units of every curve in the file."""
+        try:
+            entry = self.entry_path(path, h1, h2)
+            if not os.path.exists(entry):
+                return None
+            odict, info = self._read(entry)
+            # Touching the entry keeps it at the recent end for eviction
+            os.utime(entry)
+            return odict, info
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading from the data cache: {e}")
+            return None
+
+    def store(self, path, h1, h2, odict, info):
+        """Saves parsed curves, merged with any already stored for the file.
+        info holds info['curves'] as returned by load and any extra JSON-able
+        attributes."""
+        try:
+            entry = self.entry_path(path, h1, h2)
+            if os.path.exists(entry):
+                stored, _ = self._read(entry)
+                odict = dict(stored, **odict) if set(odict) - set(stored) else None
+            if odict is not None:
+                self._write(entry, lambda f: self._pack(f, odict, info))
+                self.evict()
+        except (OSError, ValueError, KeyError) as e:
+            # On Windows an entry mapped by a running ChromaPlot cannot be replaced
+            print(f"Error writing to the data cache: {e}")
+
+    def _read(self, entry):
+        with open(entry, 'rb') as f:
+            head = f.read(len(MAGIC) + 8)
+            if head[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{entry} is not a cache entry")
+            size, = struct.unpack('<Q', head[len(MAGIC):])
+            info = json.loads(f.read(size).decode('UTF-8'))
+        start = aligned(len(MAGIC) + 8 + size)
+        units = dict(info['curves'])
+        odict = {}
+        for curve, columns in info.pop('stored'):
+            odict[curve] = {key: mapcolumn(entry, dtype, start + offset, count)
+                            for key, (dtype, offset, count) in zip(units[curve], columns)}
+        return odict, info
+
+    def _pack(self, f, odict, info):
+        offset = 0
+        stored = []
+        arrays = []
+        for curve, columns in odict.items():
+            records = []
+            for values in columns.values():
+                values = np.ascontiguousarray(values)
+                if values.dtype.hasobject:
+                    raise ValueError(f"Cannot cache the {values.dtype} column of {curve}")
+                records.append((values.dtype.str, offset, len(values)))
+                arrays.append((offset, values))
+                offset = aligned(offset + values.nbytes)
+            stored.append((curve, records))
+        header = json.dumps(dict(info, stored=stored)).encode('UTF-8')
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        start = aligned(f.tell())
+        for offset, values in arrays:
+            f.write(bytes(start + offset - f.tell()))
+            f.write(values.tobytes())
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in
+        max_bytes, then drops key files pointing at removed entries."""
+        entries = []
+        for entry in os.scandir(self.data_dir):
+            if not entry.name.endswith('.tmp'):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        contents = {name.split('-')[0] for name in os.listdir(self.data_dir)}
+        for key in os.scandir(self.key_dir):
+            try:
+                with open(key.path, 'r') as k:
+                    if k.read().strip() not in contents:
+                        os.remove(key.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for directory in (self.key_dir, self.data_dir):
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def _write(self, path, writer):
+        """Writes via a temporary file and an atomic rename, so a reader never
+        sees a half written file."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,126 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+from contextlib import contextmanager
+
+from matplotlib.lines import Line2D
+
+import numpy as np
+
+
+class DecimationPyramid:
+    """Min/max decimation levels of one curve.
+
+    Level k splits the samples into buckets of 2**k and keeps the index of
+    the lowest and the highest sample of each bucket, each level is built
+    from the one below by comparing neighbouring buckets. Drawing the minimum
+    and maximum of every bucket in sample order gives the same picture as
+    drawing all samples as long as a bucket is no wider than a pixel, so the
+    level is picked from the number of samples in view and the width of the
+    axes. The x values have to be sorted and both x and y numeric, otherwise
+    view returns all samples.
+    """
+    MIN_BUCKETS = 256
+
+    def __init__(self, x, y):
+        n = min(len(x), len(y))
+        self.x = np.asarray(x)[:n]
+        self.y = np.asarray(y)[:n]
+        self.levels = []
+        if n < 2 or self.x.dtype.kind not in 'iuf' or self.y.dtype.kind not in 'iuf':
+            return
+        if np.any(self.x[1:] < self.x[:-1]):
+            return
+
+        imin = imax = np.arange(n)
+        while len(imin) > self.MIN_BUCKETS:
+            if len(imin) % 2:
+                imin = np.append(imin, imin[-1])
+                imax = np.append(imax, imax[-1])
+            a, b = imin[0::2], imin[1::2]
+            imin = np.where(self.y[b] < self.y[a], b, a)
+            a, b = imax[0::2], imax[1::2]
+            imax = np.where(self.y[b] > self.y[a], b, a)
+            self.levels.append((imin, imax))
+
+    def view(self, xmin, xmax, width):
+        """Returns x and y to draw the curve between xmin and xmax on an axes
+        width pixels wide, with one sample either side of the range so the
+        line runs to the edges."""
+        if not self.levels:
+            return self.x, self.y
+
+        i0 = np.searchsorted(self.x, xmin, side='left')
+        i1 = np.searchsorted(self.x, xmax, side='right')
+        buckets = 2 * max(width, 1)
+        k = 0 if i1 - i0 <= buckets else int(np.ceil(np.log2((i1 - i0) / buckets)))
+        k = min(k, len(self.levels))
+
+        if k == 0:
+            view = slice(max(i0 - 1, 0), i1 + 1)
+            return self.x[view], self.y[view]
+
+        imin, imax = self.levels[k - 1]
+        size = 2 ** k
+        b0 = max(i0 // size - 1, 0)
+        b1 = -(-i1 // size) + 1
+        lo, hi = imin[b0:b1], imax[b0:b1]
+        index = np.empty(2 * len(lo), dtype=np.intp)
+        np.minimum(lo, hi, out=index[0::2])
+        np.maximum(lo, hi, out=index[1::2])
+        return self.x[index], self.y[index]
+
+
+class DecimatedLine(Line2D):
+    """Line2D that draws a decimated copy of its data.
+
+    The full data stays the data of the line, so autoscaling, get_data and
+    the marker readout see every sample. Only while the line is drawn its
+    data is swapped for the view of a DecimationPyramid matching the current
+    x limits and axes width, which keeps the cost of a redraw down to a few
+    points per pixel however long the run is. Set decimate to False, or use
+    full_resolution, to draw every sample, as when saving a plot.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decimate = True
+        self.pyramid = None
+
+    def set_data(self, *args):
+        super().set_data(*args)
+        self.pyramid = None
+
+    def draw(self, renderer):
+        if not self.decimate or self.axes is None:
+            return super().draw(renderer)
+
+        if self.pyramid is None:
+            self.pyramid = DecimationPyramid(self._xorig, self._yorig)
+        xmin, xmax = sorted(self.axes.get_xlim())
+        x, y = self.pyramid.view(xmin, xmax, int(self.axes.bbox.width))
+
+        full = self._xorig, self._yorig
+        self._xorig, self._yorig = x, y
+        self._invalidx = self._invalidy = True
+        try:
+            super().draw(renderer)
+        finally:
+            self._xorig, self._yorig = full
+            self._invalidx = self._invalidy = True
+
+
+@contextmanager
+def full_resolution(figure):
+    """Draws every sample of the decimated lines in figure while active."""
+    lines = figure.findobj(DecimatedLine)
+    for line in lines:
+        line.decimate = False
+    try:
+        yield
+    finally:
+        for line in lines:
+            line.decimate = True
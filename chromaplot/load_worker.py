@@ -0,0 +1,126 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+import numpy as np
+
+from chromaplot.AKdatafile import AKdatafile
+from chromaplot.chromatogram_data import ChromatogramData
+from chromaplot.loader import load_file, load_files
+
+
+class LoadWorker(QObject):
+    """Parses data files away from the GUI thread.
+
+    A single file is parsed in the worker thread itself, several files are
+    handed to the process pool in chromaplot.loader. Results are reported
+    through signals as each file finishes, so the event loop keeps running
+    and the window keeps repainting while large files are parsed.
+    """
+    fileLoaded = pyqtSignal(str, object)
+    fileFailed = pyqtSignal(str, str)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(bool)
+
+    def __init__(self, file_names, prefetch=(), dtype=np.float64):
+        super().__init__()
+        self.file_names = list(file_names)
+        self.prefetch = prefetch
+        self.dtype = dtype
+        self.cancelled = False
+
+    def cancel(self):
+        # Files already being parsed run to completion, their results are dropped
+        self.cancelled = True
+
+    def run(self):
+        total = len(self.file_names)
+        done = 0
+        if total == 1:
+            results = [self.load_single(self.file_names[0])]
+        else:
+            results = load_files(self.file_names, poll=lambda: not self.cancelled, prefetch=self.prefetch, dtype=self.dtype)
+
+        for file_name, data, error in results:
+            if self.cancelled:
+                continue
+            done += 1
+            if error is not None:
+                self.fileFailed.emit(file_name, str(error))
+            else:
+                self.fileLoaded.emit(file_name, data)
+            self.progress.emit(done, total)
+
+        self.finished.emit(self.cancelled)
+
+    def load_single(self, file_name):
+        try:
+            return file_name, load_file(file_name, prefetch=self.prefetch, dtype=self.dtype), None
+        except Exception as e:
+            return file_name, None, e
+
+
+def create_load_worker(file_names, parent, prefetch=(), dtype=np.float64):
+    """Creates a LoadWorker running in its own QThread, connect to its
+    signals and then call thread.start(). Both are cleaned up once the
+    worker has finished. The curves named in prefetch are converted in the
+    background, the rest when they are first plotted."""
+    thread = QThread(parent)
+    worker = LoadWorker(file_names, prefetch, dtype)
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    worker.finished.connect(thread.quit)
+    worker.finished.connect(worker.deleteLater)
+    thread.finished.connect(thread.deleteLater)
+    return worker, thread
+
+
+class FollowWorker(QObject):
+    """Re-reads a data file that is still being written, away from the GUI
+    thread.
+
+    The first update parses the whole file, later ones only the lines added
+    since. updated is emitted with the data after every update, or None when
+    the file has not grown, and failed with the error if it could not be read.
+    """
+    updated = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_name):
+        super().__init__()
+        self.file_name = file_name
+        self.follower = None
+
+    def update(self):
+        try:
+            if self.follower is None:
+                # Keeps the state needed to append new lines later
+                follower = AKdatafile(self.file_name)
+                odict = follower.followAKdict(1, 2)
+                self.follower = follower
+            elif self.follower.updateAKdict():
+                odict = self.follower.odict
+            else:
+                self.updated.emit(None)
+                return
+            # Nothing to plot until the header has been written
+            self.updated.emit(ChromatogramData.fromdict(odict) if odict else None)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+def create_follow_worker(file_name, parent):
+    """Creates a FollowWorker living in its own QThread, which is started.
+    Connect a signal to its update slot to re-read the file, and quit and
+    wait for the thread when done, both are then cleaned up."""
+    thread = QThread(parent)
+    worker = FollowWorker(file_name)
+    worker.moveToThread(thread)
+    thread.finished.connect(worker.deleteLater)
+    thread.finished.connect(thread.deleteLater)
+    thread.start()
+    return worker, thread
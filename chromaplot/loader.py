@@ -0,0 +1,54 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from chromaplot.AKdatafile import AKdatafile
+from chromaplot.data_cache import default_cache
+
+
+def load_file(file_name, h1=1, h2=2, prefetch=(), dtype=np.float64):
+    """Opens one data file as a ChromatogramData, also used as the task run
+    in worker processes.
+
+    Only the header is read, curves are converted when first used apart from
+    those named in prefetch, or given by position, which are converted
+    before returning. Numerical columns are stored as dtype, e.g. float32 to
+    halve their memory.
+    """
+    return AKdatafile(file_name, cache=default_cache()).lazyAKdict(h1, h2, prefetch, dtype)
+
+
+def load_files(file_names, max_workers=None, poll=None, timeout=0.05, prefetch=(), dtype=np.float64):
+    """Parses several data files in a process pool, as parsing is CPU bound.
+
+    Yields (file_name, data, error) in the order the files finish, error is
+    None on success and data is None on failure, so one bad file does not
+    stop the rest. If given, poll() is called every timeout seconds while
+    waiting, e.g. to keep a GUI responsive, and returning False from it
+    cancels the files that have not started yet.
+    """
+    if max_workers is None:
+        max_workers = min(len(file_names), os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(load_file, file_name, prefetch=prefetch, dtype=dtype): file_name for file_name in file_names}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+            if poll is not None and poll() is False:
+                for future in pending:
+                    future.cancel()
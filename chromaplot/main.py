@@ -8,7 +8,7 @@ import sys
 from PyQt5.QtWidgets import QApplication
 
 from chromaplot.main_window import MainWindow
-from chromaplot.update_checker import check_for_updates, prompt_for_update
+from chromaplot.update_checker import create_update_check, prompt_for_update
 
 '''
 To do:
@@ -133,10 +133,13 @@ def main():
     app = QApplication(sys.argv)
     app.setStyleSheet(global_stylesheet)
 
-    latest_release = check_for_updates(CURRENT_VERSION)
-    if latest_release:
-        prompt_for_update(latest_release)
-
     window = MainWindow(CURRENT_VERSION)
     window.show()
+
+    # The check runs in the background once the window is up, offline it simply never reports
+    update_check = create_update_check(CURRENT_VERSION, window)
+    if update_check:
+        update_check.updateAvailable.connect(lambda latest_release: prompt_for_update(latest_release, window))
+        update_check.thread.start()
+
     sys.exit(app.exec_())
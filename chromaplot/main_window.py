@@ -4,14 +4,13 @@ Authors: Billy Hobbs and Felipe Ossa
 © 2024 Billy Hobbs. All rights reserved.
 '''
 
-from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QWidget, QDialog
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QWidget, QDialog, QCheckBox
 from PyQt5.QtGui import QPixmap, QFont
 from PyQt5.QtCore import Qt
 import sys
 import os
 
-from chromaplot.single_mode import SingleMode
-from chromaplot.overlay_mode import OverlayMode
+from chromaplot.update_checker import updates_enabled, set_updates_enabled
 
 class MainWindow(QMainWindow):
     def __init__(self, version):
@@ -119,12 +118,16 @@ class MainWindow(QMainWindow):
             return os.path.join(sys._MEIPASS, relative_path)
         return os.path.join(os.path.abspath("./chromaplot/resources/"), relative_path)
 
+    # The modes pull in matplotlib and numpy, they are imported when first opened
+    # so the welcome screen does not wait for them
     def single_mode(self):
+        from chromaplot.single_mode import SingleMode
         self.single_mode_dialog = SingleMode("Single Mode", self)
         self.hide()
         self.single_mode_dialog.show()
 
     def overlay_mode(self):
+        from chromaplot.overlay_mode import OverlayMode
         self.overlay_mode_dialog = OverlayMode(self)
         self.hide()
         self.overlay_mode_dialog.exec_()
@@ -152,4 +155,9 @@ class AboutDialog(QDialog):
         about_text.setWordWrap(True)
         layout.addWidget(about_text)
 
+        self.update_checkbox = QCheckBox("Check for updates at startup")
+        self.update_checkbox.setChecked(updates_enabled())
+        self.update_checkbox.toggled.connect(set_updates_enabled)
+        layout.addWidget(self.update_checkbox)
+
         self.setLayout(layout)
\ No newline at end of file
@@ -7,19 +7,24 @@ Authors: Billy Hobbs and Felipe Ossa
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QDialog, QFileDialog,
     QMessageBox, QCheckBox, QLabel, QDialogButtonBox, QLineEdit, QColorDialog, QComboBox, QDoubleSpinBox,
-    QButtonGroup, QRadioButton, QFrame, QSlider, QTextEdit, QSizePolicy, QGridLayout
+    QButtonGroup, QRadioButton, QFrame, QSlider, QTextEdit, QSizePolicy, QGridLayout, QProgressDialog
 )
 from PyQt5.QtCore import Qt, pyqtSignal, QSize
 from PyQt5.QtGui import QFont
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.ticker import AutoMinorLocator
 
 import numpy as np
 import os
 
-from chromaplot.AKdatafile import AKdatafile
+from chromaplot.load_worker import create_load_worker
+from chromaplot.rendering import OverlayRenderer, BlittedMarker, curve_data
+from chromaplot.redraw import RedrawScheduler
+from chromaplot.plot_config import overlay_config, render_overlay, save_config
+from chromaplot.curve_index import CurveIndex
+from chromaplot.decimation import full_resolution
 from chromaplot.help_dialogs import MainHelpDialog
 
 
@@ -44,11 +49,16 @@ class OverlayMode(QDialog):
 
         self.marker_active = False
         self.marker_position = None
+        self.marker_index = None
+        self.marker_index_key = None
 
         self.select_curves_dialog = None
         self.options_dialog = None
         self.analyse_dialog = None
 
+        self.load_worker = None
+        self.load_thread = None
+
         # Create layouts
         self.main_layout = QVBoxLayout()
         self.button_layout = QHBoxLayout()
@@ -58,6 +68,8 @@ class OverlayMode(QDialog):
         self.load_data_button = QPushButton("Load data")
         self.clear_data_button = QPushButton("Clear data")
         self.save_plot_button = QPushButton("Save plot")
+        self.save_settings_button = QPushButton("Save settings")
+        self.save_settings_button.setToolTip("Save the plot settings for batch output from the command line")
         self.options_button = QPushButton("Display options")
         self.select_curves_button = QPushButton("Select curves")
         self.analyse_button = QPushButton("Analyse")
@@ -68,6 +80,7 @@ class OverlayMode(QDialog):
         self.button_layout.addWidget(self.load_data_button)
         self.button_layout.addWidget(self.clear_data_button)
         self.button_layout.addWidget(self.save_plot_button)
+        self.button_layout.addWidget(self.save_settings_button)
         self.button_layout.addWidget(self.options_button)
         self.button_layout.addWidget(self.select_curves_button)
         self.button_layout.addWidget(self.analyse_button)
@@ -75,8 +88,12 @@ class OverlayMode(QDialog):
         self.button_layout.addWidget(self.help_button)
 
         # Create a matplotlib figure and canvas
-        self.figure = plt.figure(figsize=(7, 3.5))
+        self.figure = Figure(figsize=(7, 3.5))
         self.canvas = FigureCanvas(self.figure)
+        self.renderer = OverlayRenderer(self.figure)
+
+        # Edits in the option dialogs are drawn together once the user pauses
+        self.redraw = RedrawScheduler(self.update_plot, parent=self)
 
         frame = QFrame()
         frame.setObjectName("plotFrame")
@@ -100,6 +117,7 @@ class OverlayMode(QDialog):
         self.load_data_button.clicked.connect(self.load_data)
         self.clear_data_button.clicked.connect(self.clear_data)
         self.save_plot_button.clicked.connect(self.save_plot)
+        self.save_settings_button.clicked.connect(self.save_settings)
         self.options_button.clicked.connect(self.open_options_dialog)
         self.select_curves_button.clicked.connect(self.open_select_curves_dialog)
         self.analyse_button.clicked.connect(self.open_analyse_dialog)
@@ -127,29 +145,79 @@ class OverlayMode(QDialog):
             options=options
         )
         if file_names:
-            for file_name in file_names:
-                try:
-                    dataset_name = os.path.basename(file_name)
-                    data = AKdatafile(file_name).genAKdict(1, 2)
-
-                    if dataset_name not in self.plot_settings and dataset_name not in self.stored_plot_settings:
-                        self.plot_settings[dataset_name] = {
-                            'linestyle': '-',
-                            'linewidth': 1.5,
-                            'color': 'black',
-                            'label': dataset_name
-                        }
-
-                    self.loaded_datasets[dataset_name] = data
-                except Exception as e:
-                    QMessageBox.critical(self, "Error Loading Data", f"An error occurred while loading '{os.path.basename(file_name)}'.  Please check that it has the correct format.")
-                    return
-
-            # Open the Select Curves dialog after loading all datasets
-            self.open_select_curves_dialog()
-
-            # Update the plot with the new datasets
-            self.update_plot()
+            # Files are parsed in a background thread and added as each one finishes,
+            # single precision is plenty for overlaying and halves the memory per dataset
+            self.load_worker, self.load_thread = create_load_worker(file_names, self, prefetch=('UV',), dtype=np.float32)
+            self.load_worker.fileLoaded.connect(self.data_loaded)
+            self.load_worker.fileFailed.connect(self.data_load_failed)
+            self.load_worker.progress.connect(self.loading_progress)
+            self.load_worker.finished.connect(self.loading_finished)
+
+            self.loading_files = file_names
+            self.failed_files = []
+
+            self.load_progress = QProgressDialog("Loading data files...", "Cancel", 0, len(file_names), self)
+            self.load_progress.setWindowTitle("Load data")
+            self.load_progress.setMinimumDuration(500)
+            self.load_progress.canceled.connect(self.cancel_loading)
+            self.load_data_button.setEnabled(False)
+
+            self.load_thread.start()
+
+    def data_loaded(self, file_name, data):
+        self.add_dataset(os.path.basename(file_name), data)
+
+    def data_load_failed(self, file_name, error):
+        dataset_name = os.path.basename(file_name)
+        print(f"Error loading {dataset_name}: {error}")
+        self.failed_files.append(dataset_name)
+
+    def loading_progress(self, done, total):
+        self.load_progress.setValue(done)
+
+    def loading_finished(self, cancelled):
+        self.load_progress.close()
+        self.load_data_button.setEnabled(True)
+        self.load_worker = None
+        self.load_thread = None
+
+        # Keep the datasets in the order they were selected rather than the order they finished
+        order = {os.path.basename(file_name): i for i, file_name in enumerate(self.loading_files)}
+        for settings in (self.loaded_datasets, self.plot_settings):
+            items = sorted(settings.items(), key=lambda item: order.get(item[0], -1))
+            settings.clear()
+            settings.update(items)
+
+        # Nothing more to show once the mode has been closed
+        if not self.isVisible():
+            return
+
+        if self.failed_files:
+            QMessageBox.critical(self, "Error Loading Data", "An error occurred while loading the following files.  Please check that they have the correct format.\n\n" + "\n".join(self.failed_files))
+
+        if cancelled or not self.loaded_datasets:
+            return
+
+        # Open the Select Curves dialog after loading all datasets
+        self.open_select_curves_dialog()
+
+        # Update the plot with the new datasets
+        self.update_plot()
+
+    def cancel_loading(self):
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+
+    def add_dataset(self, dataset_name, data):
+        if dataset_name not in self.plot_settings and dataset_name not in self.stored_plot_settings:
+            self.plot_settings[dataset_name] = {
+                'linestyle': '-',
+                'linewidth': 1.5,
+                'color': 'black',
+                'label': dataset_name
+            }
+
+        self.loaded_datasets[dataset_name] = data
 
     def open_select_curves_dialog(self):
         if not self.loaded_datasets:
@@ -163,7 +231,7 @@ class OverlayMode(QDialog):
         self.select_curves_dialog.show()
 
         # Connect the signal for updating the plot with selected curves
-        self.select_curves_dialog.curveOptionsChanged.connect(self.update_plot)
+        self.select_curves_dialog.curveOptionsChanged.connect(self.redraw.request)
 
     def open_options_dialog(self):
         if not self.loaded_datasets:
@@ -203,85 +271,65 @@ class OverlayMode(QDialog):
         self.analyse_dialog.move(self.x() + 250, self.y() + 450)
         self.analyse_dialog.show()
 
-    def update_plot(self):
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-
-        handles = []
-        labels = []
-
-        for dataset_name, settings in self.plot_settings.items():
-            if dataset_name in self.loaded_datasets:
-                data = self.loaded_datasets[dataset_name]
-                curvekeys = list(data['UV'].keys())
-                x = np.array(data['UV'][curvekeys[0]])
-                y = np.array(data['UV'][curvekeys[1]])
-
-                line, = ax.plot(
-                    x, y, label=settings['label'],
-                    color=settings['color'],
-                    linestyle=settings['linestyle'],
-                    linewidth=settings['linewidth']
-                )
-                handles.append(line)
-                labels.append(settings['label'])
-
-        else:
-            # If no datasets are selected, just plot empty axes with the set limits
-            ax.plot([], [])  # Empty plot
-
-        if self.xmin is not None or self.xmax is not None:
-            ax.set_xlim(left=self.xmin, right=self.xmax)
+    def marker_values(self, x_value):
+        # UV of every loaded dataset at the marker, from an index built once per set of loaded datasets
+        key = tuple((dataset_name, id(data)) for dataset_name, data in self.loaded_datasets.items())
+        if key != self.marker_index_key:
+            self.marker_index = CurveIndex([curve_data(data, 'UV') for data in self.loaded_datasets.values()])
+            self.marker_index_key = key
+        return zip(self.loaded_datasets.keys(), self.marker_index.values(x_value))
 
-        if self.ymin is not None or self.ymax is not None:
-            ax.set_ylim(bottom=self.ymin, top=self.ymax)
-
-        ax.set_xlabel('Volume (mL)')
-        ax.set_ylabel(self.y_label)
-
-        self.ax1 = ax
-
-        if self.show_legend and handles:
-            if self.legend_location == 'upper center':
-                ax.legend(handles=handles, labels=labels, loc='upper center', bbox_to_anchor=(0.5, 1.12), ncol=10, fontsize=8)
-            else:
-                ax.legend(handles=handles, labels=labels, loc='best', fontsize=8)
-
-        plt.tight_layout()
-        self.canvas.draw()
+    def update_plot(self):
+        # Whatever was waiting to be drawn is part of this render
+        self.redraw.cancel()
+
+        # The renderer keeps one line per dataset and only changes the ones whose settings differ
+        render_overlay(self.renderer, self.loaded_datasets, self.plot_config())
+        self.ax1 = self.renderer.ax
+        self.canvas.draw_idle()
+
+    def plot_config(self):
+        # The current settings, in the form saved for and used by batch output
+        return overlay_config(
+            datasets=self.plot_settings,
+            ylabel=self.y_label,
+            xlim=(self.xmin, self.xmax), ylim=(self.ymin, self.ymax),
+            legend=self.legend_location if self.show_legend else None,
+            figsize=tuple(self.figure.get_size_inches())
+        )
 
     def set_y_label(self, label):
         if label:
             self.y_label = label
-        self.update_plot()
+        self.redraw.request()
 
     def set_x_limits(self, xmin, xmax):
         self.xmin = xmin
         self.xmax = xmax
-        self.update_plot()
+        self.redraw.request()
 
     def set_y_limits(self, ymin, ymax):
         self.ymin = ymin
         self.ymax = ymax
-        self.update_plot()
+        self.redraw.request()
 
     def reset_x_limits(self):
         self.xmin = None
         self.xmax = None
-        self.update_plot()
+        self.redraw.request()
 
     def reset_y_limits(self):
         self.ymin = None
         self.ymax = None
-        self.update_plot()       
+        self.redraw.request()       
 
     def toggle_legend(self, visible):
         self.show_legend = visible
-        self.update_plot()
+        self.redraw.request()
 
     def set_legend_location(self, location):
         self.legend_location = location
-        self.update_plot()
+        self.redraw.request()
 
     def clear_data(self):
         if self.select_curves_dialog:
@@ -299,7 +347,8 @@ class OverlayMode(QDialog):
 
         self.show_legend = False
 
-        self.figure.clear()
+        self.redraw.cancel()
+        self.renderer.reset()
         self.canvas.draw()
 
         QMessageBox.information(self, "Data Cleared", "All data cleared.")
@@ -332,7 +381,12 @@ class OverlayMode(QDialog):
                 file_name += extension
 
             try:
-                self.figure.savefig(file_name)
+                # Edits still waiting to be drawn belong in the saved plot
+                self.redraw.flush()
+
+                # The plot on screen is decimated, the saved file gets every point
+                with full_resolution(self.figure):
+                    self.figure.savefig(file_name)
                 QMessageBox.information(self, "Save Plot", "Plot saved successfully!")
             except PermissionError:
                 QMessageBox.critical(self, "Save Error", f"Permission denied: Cannot save the file '{file_name}'.")
@@ -341,7 +395,30 @@ class OverlayMode(QDialog):
             except Exception as e:
                 QMessageBox.critical(self, "Save Error", f"An unexpected error occurred: {str(e)}.")
 
+    def save_settings(self):
+        if not self.is_data_loaded():
+            return
+
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Plot Settings", "", "Plot Settings (*.json);;All Files (*)")
+        if not file_name:
+            return
+        if not file_name.lower().endswith('.json'):
+            file_name += '.json'
+
+        try:
+            # Read back by the batch command line, python -m chromaplot.batch --config
+            save_config(self.plot_config(), file_name)
+            QMessageBox.information(self, "Save Settings", "Plot settings saved successfully!")
+        except OSError as e:
+            QMessageBox.critical(self, "Save Error", f"An error occurred while saving the file '{file_name}': {str(e)}.")
+
     def close_dialog(self):
+        self.cancel_loading()
+        if self.load_thread is not None:
+            # Files being parsed are finished first, their results are dropped
+            self.load_thread.quit()
+            self.load_thread.wait()
+        self.redraw.cancel()
         if self.select_curves_dialog:
             self.select_curves_dialog.close()
         if self.options_dialog:
@@ -686,6 +763,7 @@ class OverlayAnalyseDialog(QDialog):
 
         self.parent = parent
         self.marker_line = None
+        self.marker = None
 
         # Create layout
         self.layout = QVBoxLayout()
@@ -757,6 +835,7 @@ class OverlayAnalyseDialog(QDialog):
 
         # Add the vertical marker line to the plot
         self.marker_line = ax1.axvline(initial_position, color='red', linestyle='--')
+        self.marker = BlittedMarker(self.parent.canvas, self.marker_line)
 
         # Update the y-values for the initial position
         self.update_y_values(initial_position)
@@ -766,40 +845,21 @@ class OverlayAnalyseDialog(QDialog):
 
     def remove_vertical_marker(self):
         if self.marker_line:
-            self.marker_line.remove()
+            self.marker.remove()
+            self.marker = None
             self.marker_line = None
             self.y_values_display.clear()
             self.parent.canvas.draw()
 
-    # This version works properly but is slow because the whole plot 
-    # needs to be updated as the marker is moved
-    # def update_marker_position(self, value):
-    #     if self.marker_line:
-    #         self.marker_line.set_xdata([value / 100, value / 100])
-    #         self.update_y_values(value / 100)
-    #         self.parent.update_marker_state(True, value / 100)  # Update the parent's marker state with the new position
-    #         self.parent.canvas.draw()
-
-    # This version is quicker, but messes up when other aspects of the plot is changed
-    # Marker needs to be turned on and off again
-    
     def update_marker_position(self, value):
         if self.marker_line:
             x_value = value / 100.0
-            # Update the marker line's position without redrawing the entire canvas
-            self.marker_line.set_xdata([x_value, x_value])
+            # Only the marker is redrawn, on top of the background kept from the last full draw
+            self.marker.move(x_value)
             self.update_y_values(x_value)
-            self.parent.canvas.draw_idle()
 
     def update_y_values(self, x_value):
-        y_values = {}
-
-        for dataset_name, data in self.parent.loaded_datasets.items():
-            curvekeys = list(data['UV'].keys())
-            x_data = np.array(data['UV'][curvekeys[0]])
-            y_data = np.array(data['UV'][curvekeys[1]])
-            y_value = np.interp(x_value, x_data, y_data)
-            y_values[dataset_name] = y_value
+        y_values = dict(self.parent.marker_values(x_value))
 
         y_values_str = f"Marker Position: {x_value:.2f} mL\n"
         y_values_str += "\n".join([f"{dataset}: {y:.2f} mAU" for dataset, y in y_values.items()])
@@ -0,0 +1,180 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import json
+
+# Bump whenever the meaning of a field changes
+CONFIG_VERSION = 1
+
+DEFAULT_UV = {'linestyle': '-', 'linewidth': 1.5, 'color': 'black', 'ylabel': 'Absorbance (mAU)', 'label': 'UV'}
+DEFAULT_STYLE = {'linestyle': '-', 'linewidth': 1.5, 'color': 'black'}
+COLORS = ['r', 'g', 'b', 'c', 'm']
+FIGSIZE = (7, 3.5)
+
+
+def single_config(curves=None, xlim=(None, None), ylim=(None, None), legend=None,
+                  fraction_labels=False, shaded_regions=(), figsize=FIGSIZE):
+    """Settings of a Single Mode plot, as used by render_single.
+
+    curves maps curve names to their options, 'UV' holding the options of the
+    first curve of the file. legend is the legend location or None to hide it.
+    shaded_regions holds (start, stop, mode, color, alpha) tuples, with start
+    and stop in mL for the 'Volumes' mode or fraction numbers for the
+    'Fractions' mode, so a saved configuration shades the same fractions in
+    every run it is applied to.
+    """
+    return {
+        'mode': 'single',
+        'version': CONFIG_VERSION,
+        'curves': curves if curves is not None else {'UV': dict(DEFAULT_UV)},
+        'xlim': list(xlim),
+        'ylim': list(ylim),
+        'legend': legend,
+        'fraction_labels': fraction_labels,
+        'shaded_regions': [list(region) for region in shaded_regions],
+        'figsize': list(figsize)
+    }
+
+
+def overlay_config(datasets=None, ylabel='Absorbance (mAU)', xlim=(None, None), ylim=(None, None),
+                   legend=None, style=None, figsize=FIGSIZE):
+    """Settings of an Overlay Mode plot, as used by render_overlay.
+
+    datasets maps dataset names to their linestyle, linewidth, color and
+    label, style is used for datasets without an entry of their own.
+    """
+    return {
+        'mode': 'overlay',
+        'version': CONFIG_VERSION,
+        'datasets': datasets if datasets is not None else {},
+        'style': style if style is not None else dict(DEFAULT_STYLE),
+        'ylabel': ylabel,
+        'xlim': list(xlim),
+        'ylim': list(ylim),
+        'legend': legend,
+        'figsize': list(figsize)
+    }
+
+
+def save_config(config, file_name):
+    with open(file_name, 'w', encoding='UTF-8') as f:
+        json.dump(config, f, indent=2)
+
+
+def load_config(file_name):
+    """Reads a saved configuration, fields missing from the file take their
+    default values."""
+    with open(file_name, 'r', encoding='UTF-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{file_name} does not hold a plot configuration")
+
+    mode = config.get('mode', 'single')
+    if mode == 'single':
+        defaults = single_config()
+    elif mode == 'overlay':
+        defaults = overlay_config()
+    else:
+        raise ValueError(f"Unknown plot mode '{mode}' in {file_name}")
+    defaults.update(config)
+    return defaults
+
+
+def has_fractions(data):
+    return 'Fraction' in data and {'ml', 'Fraction'} <= set(data['Fraction'].keys())
+
+
+def plotted_curves(data, selected_curves, colors=COLORS):
+    """(name, options) pairs to plot, the first curve of the file with the UV
+    options, then the selected curves present in data."""
+    keys = [x for x in data.keys()]
+    curves = [(keys[0], selected_curves.get('UV', DEFAULT_UV))]
+
+    for i, (curve, options) in enumerate(selected_curves.items()):
+        if curve != 'UV' and curve in data:
+            curves.append((curve, {
+                'linestyle': options.get('linestyle', '-'),
+                'linewidth': options.get('linewidth', 1.5),
+                'color': options.get('color', colors[i % len(colors)]),
+                'ylabel': options.get('ylabel', curve),
+                'label': options.get('label', curve)
+            }))
+    return curves
+
+
+def fraction_volumes(data, start_fraction, stop_fraction):
+    """Volumes from the start of start_fraction to the end of stop_fraction,
+    raises ValueError with a message for the user if they cannot be found."""
+    try:
+        fractions = data['Fraction']['Fraction']
+        volumes = data['Fraction']['ml']
+    except KeyError:
+        raise ValueError("Fraction data does not seem to be present.")
+
+    # Clean and convert fraction numbers to integers
+    fractions = [int(x.strip("T\"")) for x in fractions if x.strip("T\"").isdigit()]
+
+    if int(start_fraction) not in fractions or int(stop_fraction) not in fractions:
+        raise ValueError("Specified fractions are not in the data.")
+
+    start_index = fractions.index(int(start_fraction))
+    stop_index = fractions.index(int(stop_fraction))
+
+    start_vol = volumes[start_index]
+    if stop_index + 1 < len(volumes):
+        stop_vol = volumes[stop_index + 1]
+    else:
+        stop_vol = volumes[stop_index]
+    return start_vol, stop_vol
+
+
+def shaded_volumes(data, shaded_regions):
+    """Turns (start, stop, mode, color, alpha) regions into the
+    (start, stop, color, alpha) volume ranges drawn by the renderer. Like the
+    fraction labels, regions given as fractions the run does not have are
+    left out, so one configuration can be applied to any run."""
+    regions = []
+    for start, stop, mode, color, alpha in shaded_regions:
+        if mode == 'Fractions':
+            try:
+                start, stop = fraction_volumes(data, start, stop)
+            except ValueError:
+                continue
+        regions.append((start, stop, color, alpha))
+    return regions
+
+
+def render_single(renderer, data, config, marker=None):
+    """Draws data with a Single Mode configuration on a SingleRenderer, the
+    same call for the plot on screen and for batch output."""
+    renderer.render(
+        data, plotted_curves(data, config['curves']),
+        xlim=tuple(config['xlim']), ylim=tuple(config['ylim']),
+        legend=config['legend'],
+        fraction_labels=config['fraction_labels'] and has_fractions(data),
+        shaded_regions=shaded_volumes(data, config['shaded_regions']),
+        marker=marker
+    )
+
+
+def overlay_settings(dataset_names, config):
+    """Plot settings for dataset_names, those without an entry in the
+    configuration get its default style and their name as label."""
+    settings = {}
+    for name in dataset_names:
+        settings[name] = config['datasets'].get(name) or dict(config['style'], label=name)
+    return settings
+
+
+def render_overlay(renderer, datasets, config):
+    """Draws datasets with an Overlay Mode configuration on an OverlayRenderer,
+    the same call for the plot on screen and for batch output."""
+    renderer.render(
+        datasets, config['datasets'],
+        xlim=tuple(config['xlim']), ylim=tuple(config['ylim']),
+        ylabel=config['ylabel'],
+        legend=config['legend']
+    )
@@ -0,0 +1,43 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+from PyQt5.QtCore import QObject, QTimer
+
+
+class RedrawScheduler(QObject):
+    """Coalesces redraw requests from the option dialogs into one render.
+
+    Edits only change the settings of a mode and call request, the render
+    itself runs once the coalescing window has passed and reads whatever the
+    settings are by then, so intermediate states in between are never drawn.
+    The window is not restarted by later requests, a spin box held down
+    therefore renders at a steady rate of at most one frame per interval
+    instead of queueing a render for every step.
+    """
+    INTERVAL = 40
+
+    def __init__(self, render, interval=INTERVAL, parent=None):
+        super().__init__(parent)
+        self.render = render
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.render)
+
+    def request(self, *args):
+        """Schedules a render, arguments of the signal calling it are ignored."""
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """Renders now if a render is pending."""
+        if self.timer.isActive():
+            self.timer.stop()
+            self.render()
+
+    def cancel(self):
+        """Drops a pending render, for when the plot was just rendered or cleared."""
+        self.timer.stop()
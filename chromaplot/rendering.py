@@ -0,0 +1,541 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+from matplotlib import rcParams
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.layout_engine import TightLayoutEngine
+from matplotlib.ticker import AutoMinorLocator
+
+import numpy as np
+
+from chromaplot.decimation import DecimatedLine
+
+
+def curve_data(data, name):
+    """Returns the x and y columns of a curve, the first two units of it."""
+    curve = data[name]
+    curvekeys = list(curve.keys())
+    return curve[curvekeys[0]], curve[curvekeys[1]]
+
+
+def line_data(axis, x, y):
+    """Converts x and y to the units of axis, as ax.plot does, so a curve of
+    text such as the logbook is drawn with a category axis."""
+    axis.xaxis.update_units(x)
+    axis.yaxis.update_units(y)
+    return axis.convert_xunits(x), axis.convert_yunits(y)
+
+
+class LayoutCache:
+    """Remembers the subplot parameters of the tight layouts of a figure.
+
+    Measuring every piece of text for a tight layout costs about as much as
+    drawing the figure, yet the result only depends on what is around the
+    axes: the tick labels, which follow from the limits, the axis labels, the
+    number of axes, a legend placed outside the plot and the size of the
+    canvas. update takes a key describing all but the size, and the layout is
+    only measured for a key and size not seen before. A resized canvas is
+    laid out again for its new size.
+    """
+    MAX_ENTRIES = 32
+
+    def __init__(self, figure):
+        self.figure = figure
+        self.params = {}
+        self.key = None
+        self.figure.canvas.mpl_connect('resize_event', self.on_resize)
+
+    def update(self, key):
+        key = (tuple(self.figure.bbox.size), key)
+        if key == self.key:
+            return
+        self.key = key
+
+        params = self.params.get(key)
+        if params is None:
+            # A legend above the axes moves with them, start from the default layout so the
+            # result only depends on the key and not on the layout before
+            self.figure.subplots_adjust(**{side: rcParams[f'figure.subplot.{side}'] for side in ('left', 'right', 'bottom', 'top')})
+            TightLayoutEngine().execute(self.figure)
+            subplotpars = self.figure.subplotpars
+            params = dict(left=subplotpars.left, right=subplotpars.right, bottom=subplotpars.bottom, top=subplotpars.top)
+            if len(self.params) >= self.MAX_ENTRIES:
+                del self.params[next(iter(self.params))]
+            self.params[key] = params
+        else:
+            self.figure.subplots_adjust(**params)
+
+    def on_resize(self, event):
+        if self.key is not None:
+            self.update(self.key[1])
+
+
+class SingleRenderer:
+    """Retained-mode drawing of the Single Mode plot.
+
+    The axes, lines and other artists are created once and kept between
+    calls to render, which only changes what differs from the previous call:
+    line styles and labels are set on the existing lines, new data is swapped
+    in with set_data, limits are applied to the existing axes, and the legend,
+    fraction labels, shading and marker are only rebuilt when their own inputs
+    change. Twin axes are kept in a pool and reused as curves are selected and
+    deselected, and the layout is only recomputed when something that affects
+    it has changed. Nothing here depends on Qt.
+    """
+
+    def __init__(self, figure):
+        self.figure = figure
+        self.layout = LayoutCache(figure)
+        # Connected after the layout, so the axes have their new size by then
+        self.figure.canvas.mpl_connect('resize_event', self.on_resize)
+        self.reset()
+
+    def reset(self):
+        """Clears the figure and forgets all artists."""
+        self.figure.clear()
+        self.ax1 = None
+        self.y_axes = []
+        self.twin_axes = []
+        self.spines_key = None
+        self.primary = None
+        self.primary_name = None
+        self.lines = {}
+        self.data = None
+        self.limits_key = None
+        self.legend_key = None
+        self.fraction_labels = []
+        self.fraction_key = None
+        self.show_fraction_labels = False
+        self.fractions = None
+        self.shading = []
+        self.shading_keys = []
+        self.shading_data = None
+        self.marker_line = None
+        self.layout.key = None
+
+    @property
+    def curve_lines(self):
+        """(curve, Line2D) pairs in plotting order, the first one on ax1."""
+        return [(self.primary_name, self.primary)] + list(self.lines.items())
+
+    def render(self, data, curves, xlim=(None, None), ylim=(None, None), legend=None,
+               fraction_labels=False, shaded_regions=(), marker=None):
+        """Brings the figure up to date.
+
+        curves lists (name, options) pairs, the first curve is drawn on the
+        left axis and every other one on its own twin axis. options holds the
+        linestyle, linewidth, color, ylabel and label of the curve. legend is
+        the legend location or None to hide it, shaded_regions holds
+        (start, stop, color, alpha) tuples shaded under the first curve and
+        marker is the volume of the marker line or None.
+        """
+        new_data = data is not self.data
+        self.data = data
+
+        if self.ax1 is None:
+            self.ax1 = self.figure.add_subplot(111)
+            self.ax1.xaxis.set_minor_locator(AutoMinorLocator(5))
+            self.ax1.set_xlabel('Volume (mL)')
+
+        name, options = curves[0]
+        if self.primary is None:
+            self.primary = self.ax1.add_line(DecimatedLine(*line_data(self.ax1, *curve_data(data, name))))
+        elif new_data or name != self.primary_name:
+            self.primary.set_data(*line_data(self.ax1, *curve_data(data, name)))
+        self.primary_name = name
+        self.style(self.primary, self.ax1, options)
+
+        # One twin axis per further curve, taken from a pool. A deselected
+        # curve hides its axis, which is handed to the next curve selected
+        selected = dict(curves[1:])
+        for name in list(self.lines):
+            if name not in selected:
+                self.release_twin(self.lines.pop(name).axes)
+        for name, options in selected.items():
+            line = self.lines.get(name)
+            try:
+                if line is None:
+                    line = self.free_twin_line()
+                    line.set_data(*line_data(line.axes, *curve_data(data, name)))
+                    line.axes.set_visible(True)
+                    self.lines[name] = line
+                elif new_data:
+                    line.set_data(*line_data(line.axes, *curve_data(data, name)))
+            except Exception as e:
+                # Leave the curve out rather than the whole plot
+                print("Error plotting curve:", e)
+                self.lines.pop(name, None)
+                if line is not None:
+                    self.release_twin(line.axes)
+                continue
+            self.style(line, line.axes, options)
+
+        self.lines = {name: self.lines[name] for name in selected if name in self.lines}
+        self.y_axes = [self.ax1] + [line.axes for line in self.lines.values()]
+        if self.spines_key != [id(axis) for axis in self.y_axes]:
+            self.spines_key = [id(axis) for axis in self.y_axes]
+            for i, axis in enumerate(self.y_axes[1:], start=1):
+                # Draw the curves in the order they were selected, whichever axis they got
+                axis.set_zorder(i)
+                # Moving a spine resets the ticks of its axis, so only move it when needed
+                position = ('outward', 0.0 if i == 1 else (25 if i == 2 else 40) * i)
+                if axis.spines['right'].get_position() != position:
+                    axis.spines['right'].set_position(position)
+
+        self.set_limits(xlim, ylim)
+
+        handles = [line for name, line in self.curve_lines]
+        self.set_legend(legend, handles)
+        self.set_shading(shaded_regions)
+        self.set_marker(marker)
+        self.update_layout(legend)
+        # Labels are thinned to the width of the axes, so they come after the layout
+        self.show_fraction_labels = fraction_labels
+        self.set_fraction_labels(fraction_labels)
+
+    def free_twin_line(self):
+        for axis in self.twin_axes:
+            if not axis.get_visible():
+                return axis.lines[0]
+        axis = self.ax1.twinx()
+        self.twin_axes.append(axis)
+        return axis.add_line(DecimatedLine([], []))
+
+    def release_twin(self, axis):
+        # An axis that took on the categories of a text curve cannot show
+        # numbers again, so it is removed instead of going back to the pool
+        if axis.yaxis.get_units() is not None:
+            self.twin_axes.remove(axis)
+            axis.remove()
+        else:
+            axis.set_visible(False)
+
+    def style(self, line, axis, options):
+        line.set_color(options['color'])
+        line.set_linestyle(options['linestyle'])
+        line.set_linewidth(options['linewidth'])
+        line.set_label(options['label'])
+        axis.set_ylabel(options['ylabel'])
+
+    def set_limits(self, xlim, ylim):
+        key = (id(self.data), tuple(self.lines), xlim, ylim)
+        if key == self.limits_key:
+            return
+        self.limits_key = key
+
+        xmin, xmax = xlim
+        left = 0 if xmin is None else xmin
+        right = np.max(self.primary.get_xdata()) if xmax is None else xmax
+        self.ax1.set_xlim(left, right)
+
+        # Autoscale every y axis to its curve, the fraction ticks, shading
+        # and marker do not take part in it
+        for axis in self.y_axes:
+            axis.set_autoscaley_on(True)
+            axis.relim(visible_only=True)
+            axis.autoscale_view(scalex=False)
+
+        ymin, ymax = ylim
+        if ymin is not None or ymax is not None:
+            self.ax1.set_ylim(bottom=ymin, top=ymax)
+
+        # Fix the limits, so the shading added below does not rescale the axes
+        for axis in self.y_axes:
+            axis.set_ylim(axis.get_ylim())
+
+    def set_legend(self, location, handles):
+        key = location and (location, tuple((line.get_label(), line.get_color(), line.get_linestyle(), line.get_linewidth())
+                                            for line in handles))
+        if key == self.legend_key:
+            return
+        self.legend_key = key
+
+        if location is None:
+            if self.ax1.get_legend() is not None:
+                self.ax1.get_legend().remove()
+        elif location == 'upper center':
+            self.ax1.legend(loc='upper center', bbox_to_anchor=(0.5, 1.12), ncol=10, fontsize=8,
+                            handles=handles, labels=[line.get_label() for line in handles])
+        else:
+            self.ax1.legend(loc='best', fontsize=8, handles=handles, labels=[line.get_label() for line in handles])
+
+    def on_resize(self, event):
+        # The labels are thinned for the width of the axes, which has changed
+        if self.ax1 is not None and self.show_fraction_labels:
+            self.set_fraction_labels(True)
+
+    def set_fraction_labels(self, visible, stript=True, fontsize=6, labheight=0.02, tickheight=0.05):
+        # Ticks and labels sit at a fixed height in axes coordinates, so only
+        # new data, the x range or the width of the axes change them
+        key = visible and (id(self.data), self.ax1.get_xlim(), round(self.ax1.bbox.width))
+        if key == self.fraction_key:
+            return
+        self.fraction_key = key
+
+        for artist in self.fraction_labels:
+            artist.remove()
+        self.fraction_labels = []
+        if not visible:
+            return
+
+        if self.fractions is None or self.fractions[0] != id(self.data):
+            self.fractions = (id(self.data),) + self.fraction_arrays(stript)
+        f, flabx, flab, keep = self.fractions[1:]
+
+        # One collection for the start and end tick of every collected fraction
+        ticks = np.unique(np.concatenate([f[keep], f[1:][keep[:-1]]]))
+        segments = np.zeros((len(ticks), 2, 2))
+        segments[:, :, 0] = ticks[:, None]
+        segments[:, 1, 1] = tickheight
+        self.fraction_labels.append(self.ax1.add_collection(
+            LineCollection(segments, colors='red', linestyles=':', transform=self.ax1.get_xaxis_transform(), in_layout=False),
+            autolim=False))
+
+        x_min, x_max = self.ax1.get_xlim()
+        shown = np.flatnonzero(keep[:-1] & (flabx >= x_min) & (flabx <= x_max))
+        for i in self.thin_labels(flabx[shown], flab[shown], fontsize):
+            self.fraction_labels.append(self.ax1.text(flabx[shown[i]], labheight, flab[shown[i]], fontsize=fontsize,
+                                                      ha='center', va='center', transform=self.ax1.get_xaxis_transform(),
+                                                      in_layout=False))
+
+    def fraction_arrays(self, stript):
+        """Fraction start volumes, label positions halfway to the next
+        fraction, labels and a mask of the fractions that were collected."""
+        f = np.asarray(self.data['Fraction']['ml'], dtype=np.float64)
+        flab = np.asarray(self.data['Fraction']['Fraction'], dtype=str)[:len(f)]
+        f = f[:len(flab)]
+        if stript:
+            flab = np.char.strip(flab, "T\"")
+        flabx = (f[:-1] + f[1:]) / 2
+        return f, flabx, flab, flab != "Waste"
+
+    def thin_labels(self, x, labels, fontsize, pad=3):
+        """Indices of the labels to draw, left to right, leaving out any label
+        that would overlap the one before it at the current zoom."""
+        if not len(x):
+            return []
+        px = self.ax1.transData.transform(np.column_stack([x, np.zeros(len(x))]))[:, 0]
+        # Digits of the default font are about 0.65 em wide
+        half = np.char.str_len(labels) * fontsize * 0.325 * self.figure.dpi / 72
+        kept = [0]
+        for i in range(1, len(x)):
+            if px[i] - half[i] >= px[kept[-1]] + half[kept[-1]] + pad:
+                kept.append(i)
+        return kept
+
+    def set_shading(self, shaded_regions):
+        # Regions are added and undone at the end of the list, so the
+        # polygons of the regions in front that did not change are kept
+        baseline = self.ax1.get_ylim()[0]
+        keys = [(id(self.data), baseline) + tuple(region) for region in shaded_regions]
+        kept = 0
+        while kept < min(len(keys), len(self.shading_keys)) and keys[kept] == self.shading_keys[kept]:
+            kept += 1
+        for artist in self.shading[kept:]:
+            artist.remove()
+        del self.shading[kept:]
+
+        for start_vol, stop_vol, color, alpha in shaded_regions[kept:]:
+            # Shade the area under the curve down to the bottom of the plot
+            polygon = PolyCollection([self.shading_polygon(start_vol, stop_vol, baseline)], color=color, alpha=alpha)
+            self.shading.append(self.ax1.add_collection(polygon, autolim=False))
+        self.shading_keys = keys
+
+    def shading_polygon(self, start_vol, stop_vol, baseline):
+        """Vertices of the area under the first curve between two volumes,
+        the samples in range are found by bisection on the sorted volumes."""
+        if self.shading_data is None or self.shading_data[0] != id(self.data):
+            xdata, ydata = (np.asarray(values, dtype=np.float64) for values in self.primary.get_data())
+            self.shading_data = (id(self.data), xdata, ydata, not np.any(xdata[1:] < xdata[:-1]))
+        xdata, ydata, is_sorted = self.shading_data[1:]
+
+        if is_sorted:
+            i0 = np.searchsorted(xdata, start_vol, side='left')
+            i1 = np.searchsorted(xdata, stop_vol, side='right')
+            x, y = xdata[i0:i1], ydata[i0:i1]
+        else:
+            mask = (xdata >= start_vol) & (xdata <= stop_vol)
+            x, y = xdata[mask], ydata[mask]
+        if not len(x):
+            return np.empty((0, 2))
+        return np.concatenate([[[x[0], baseline]], np.column_stack([x, y]), [[x[-1], baseline]]])
+
+    def set_marker(self, position):
+        if position is None:
+            if self.marker_line is not None:
+                self.marker_line.remove()
+                self.marker_line = None
+        elif self.marker_line is None:
+            self.marker_line = self.ax1.axvline(position, color='red', linestyle='--')
+        else:
+            self.marker_line.set_xdata([position])
+
+    def update_layout(self, legend):
+        # Tick labels, axis labels, the number of axes and a legend placed
+        # above the plot decide the layout, a new colour or line style does not
+        key = (legend == 'upper center',
+               tuple((axis.get_ylabel(), axis.get_ylim()) for axis in self.y_axes),
+               self.ax1.get_xlim())
+        self.layout.update(key)
+
+
+class OverlayRenderer:
+    """Retained-mode drawing of the Overlay Mode plot.
+
+    Each dataset keeps its own Line2D between calls to render, together with
+    the settings and data it was last drawn with. A line is only touched when
+    those differ, so adding, removing or restyling one run leaves the lines of
+    all other runs alone. The data limits are only recomputed when the set of
+    plotted runs changes; axis limits, the y label and the legend are applied
+    on their own and never replot data.
+    """
+
+    def __init__(self, figure):
+        self.figure = figure
+        self.layout = LayoutCache(figure)
+        self.reset()
+
+    def reset(self):
+        """Clears the figure and forgets all artists."""
+        self.figure.clear()
+        self.ax = None
+        self.lines = {}
+        self.drawn = {}
+        self.autolim = None
+        self.data_key = None
+        self.legend_key = None
+        self.layout.key = None
+
+    def render(self, datasets, plot_settings, xlim=(None, None), ylim=(None, None),
+               ylabel='Absorbance (mAU)', legend=None):
+        """Brings the figure up to date.
+
+        datasets maps dataset names to their data and plot_settings the names
+        of the datasets to plot to their linestyle, linewidth, color and label.
+        legend is the legend location or None to hide it.
+        """
+        if self.ax is None:
+            self.ax = self.figure.add_subplot(111)
+            self.ax.set_xlabel('Volume (mL)')
+
+        plotted = [name for name in plot_settings if name in datasets]
+        for name in list(self.lines):
+            if name not in plotted:
+                self.lines.pop(name).remove()
+                del self.drawn[name]
+
+        for name in plotted:
+            settings = plot_settings[name]
+            data = datasets[name]
+            state = (id(data), settings['label'], settings['color'], settings['linestyle'], settings['linewidth'])
+            if state == self.drawn.get(name):
+                continue
+
+            line = self.lines.get(name)
+            if line is None:
+                line = self.ax.add_line(DecimatedLine(*line_data(self.ax, *curve_data(data, 'UV'))))
+                self.lines[name] = line
+            elif self.drawn[name][0] != state[0]:
+                line.set_data(*line_data(self.ax, *curve_data(data, 'UV')))
+            line.set_label(settings['label'])
+            line.set_color(settings['color'])
+            line.set_linestyle(settings['linestyle'])
+            line.set_linewidth(settings['linewidth'])
+            self.drawn[name] = state
+
+        self.lines = {name: self.lines[name] for name in plotted}
+        self.ax.set_ylabel(ylabel)
+        self.set_limits(xlim, ylim)
+        self.set_legend(legend)
+        self.update_layout(legend)
+
+    def set_limits(self, xlim, ylim):
+        # The data limits only change with the plotted runs or their data
+        key = tuple((name, self.drawn[name][0]) for name in self.lines)
+        if key != self.data_key:
+            self.data_key = key
+            self.ax.set_autoscale_on(True)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            self.autolim = (self.ax.get_xlim(), self.ax.get_ylim())
+
+        (left, right), (bottom, top) = self.autolim
+        self.ax.set_xlim(left if xlim[0] is None else xlim[0], right if xlim[1] is None else xlim[1])
+        self.ax.set_ylim(bottom if ylim[0] is None else ylim[0], top if ylim[1] is None else ylim[1])
+
+    def set_legend(self, location):
+        handles = list(self.lines.values())
+        key = location and handles and (location, tuple(self.drawn[name][1:] for name in self.lines))
+        if key == self.legend_key:
+            return
+        self.legend_key = key
+
+        if not key:
+            if self.ax.get_legend() is not None:
+                self.ax.get_legend().remove()
+        elif location == 'upper center':
+            self.ax.legend(handles=handles, labels=[line.get_label() for line in handles],
+                           loc='upper center', bbox_to_anchor=(0.5, 1.12), ncol=10, fontsize=8)
+        else:
+            self.ax.legend(handles=handles, labels=[line.get_label() for line in handles], loc='best', fontsize=8)
+
+    def update_layout(self, legend):
+        key = (bool(self.legend_key) and legend == 'upper center', self.ax.get_ylabel(),
+               self.ax.get_xlim(), self.ax.get_ylim())
+        self.layout.update(key)
+
+
+class BlittedMarker:
+    """Moves a marker line across the plot without redrawing the figure.
+
+    The line is animated, so full draws of the figure leave it out. After
+    each full draw the rendered figure is kept as the background and the line
+    is drawn on top of it. Moving the marker restores that background, draws
+    the line at its new position and blits the result to the screen. Any
+    change to the plot ends in a full draw, which takes a new background, and
+    a resize drops the background until the next full draw.
+    """
+
+    def __init__(self, canvas, line):
+        self.canvas = canvas
+        self.line = line
+        self.line.set_animated(True)
+        self.background = None
+        self.bounds = None
+        self.callbacks = [
+            canvas.mpl_connect('draw_event', self.on_draw),
+            canvas.mpl_connect('resize_event', self.invalidate),
+        ]
+
+    def on_draw(self, event):
+        if self.line.axes is None:
+            return
+        if event.canvas is not self.canvas:
+            # Saving to another format, draw the marker like any other line
+            self.line.draw(event.renderer)
+            return
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.bounds = self.canvas.figure.bbox.bounds
+        self.line.axes.draw_artist(self.line)
+
+    def invalidate(self, event=None):
+        self.background = None
+
+    def move(self, x_value):
+        self.line.set_xdata([x_value, x_value])
+        if self.background is None or self.bounds != self.canvas.figure.bbox.bounds or self.line.axes is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.line.axes.draw_artist(self.line)
+        self.canvas.blit(self.line.axes.bbox)
+
+    def remove(self):
+        for cid in self.callbacks:
+            self.canvas.mpl_disconnect(cid)
+        if self.line.axes is not None:
+            self.line.remove()
+        self.background = None
@@ -7,23 +7,29 @@ Authors: Billy Hobbs and Felipe Ossa
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QHBoxLayout, QVBoxLayout, QWidget, QDialog, QFileDialog,
     QMessageBox, QCheckBox, QLabel, QDialogButtonBox, QLineEdit, QColorDialog, QComboBox, QDoubleSpinBox,
-    QButtonGroup, QRadioButton, QFrame, QSlider, QTextEdit, QSizePolicy, QGridLayout, QTabWidget
+    QButtonGroup, QRadioButton, QFrame, QSlider, QTextEdit, QSizePolicy, QGridLayout, QTabWidget,
+    QProgressDialog
 )
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
 from PyQt5.QtGui import QFont
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
-from matplotlib.ticker import AutoMinorLocator
+from matplotlib.figure import Figure
 
-import numpy as np
 import os
 
-from chromaplot.AKdatafile import AKdatafile
+from chromaplot.load_worker import create_load_worker, create_follow_worker
+from chromaplot.rendering import SingleRenderer, BlittedMarker
+from chromaplot.redraw import RedrawScheduler
+from chromaplot.plot_config import single_config, render_single, has_fractions, fraction_volumes, save_config
+from chromaplot.curve_index import CurveIndex
+from chromaplot.decimation import full_resolution
 from chromaplot.help_dialogs import MainHelpDialog
 
 
 class SingleMode(QDialog):
+    followRequested = pyqtSignal()
+
     def __init__(self, mode_name, parent=None):
         super().__init__(parent)
         self.setWindowTitle(f"Single Mode")
@@ -35,8 +41,6 @@ class SingleMode(QDialog):
         self.show_fraction_labels = False
         self.legend_location = 'upper center'
 
-        self.colors = ['r', 'g', 'b', 'c', 'm']
-
         self.shaded_regions = []
         self.show_shaded_fractions = False
         self.selected_curves = {'UV': {'linestyle': '-', 'linewidth': 1.5, 'color': 'black', 'ylabel': 'Absorbance (mAU)', 'label': 'UV'}}
@@ -51,6 +55,21 @@ class SingleMode(QDialog):
 
         self.marker_active = False
         self.marker_position = None
+        self.marker_index = None
+        self.marker_index_key = None
+
+        self.load_worker = None
+        self.load_thread = None
+
+        # Following a file that is still being written
+        self.follow_worker = None
+        self.follow_thread = None
+        self.follow_busy = False
+        self.follow_started = False
+        self.curve_lines = []
+        self.follow_timer = QTimer(self)
+        self.follow_timer.setInterval(2000)
+        self.follow_timer.timeout.connect(self.follow_file)
 
         # Create layouts
         self.main_layout = QVBoxLayout()
@@ -62,25 +81,35 @@ class SingleMode(QDialog):
         self.load_data_button = QPushButton("Load data")
         self.clear_data_button = QPushButton("Clear data")
         self.save_plot_button = QPushButton("Save plot")
+        self.save_settings_button = QPushButton("Save settings")
+        self.save_settings_button.setToolTip("Save the plot settings for batch output from the command line")
         self.options_button = QPushButton("Display options")
         self.select_curves_button = QPushButton("Select curves")
         self.analyse_button = QPushButton("Analyse")
         self.back_button = QPushButton("Back")
         self.help_button = QPushButton("Help")
+        self.follow_checkbox = QCheckBox("Follow file")
+        self.follow_checkbox.setToolTip("Re-read the file every few seconds and extend the plot, for runs that are still being exported")
 
         # Add buttons to the button layout
         self.button_layout.addWidget(self.load_data_button)
         self.button_layout.addWidget(self.clear_data_button)
         self.button_layout.addWidget(self.save_plot_button)
+        self.button_layout.addWidget(self.save_settings_button)
         self.button_layout.addWidget(self.options_button)
         self.button_layout.addWidget(self.select_curves_button)
         self.button_layout.addWidget(self.analyse_button)
+        self.button_layout.addWidget(self.follow_checkbox)
         self.button_layout.addWidget(self.back_button)
         self.button_layout.addWidget(self.help_button)
 
         # Create a matplotlib figure and canvas
-        self.figure = plt.figure(figsize=(7,3.5))
+        self.figure = Figure(figsize=(7,3.5))
         self.canvas = FigureCanvas(self.figure)
+        self.renderer = SingleRenderer(self.figure)
+
+        # Edits in the option dialogs are drawn together once the user pauses
+        self.redraw = RedrawScheduler(self.update_plot, parent=self)
 
         frame = QFrame()
         frame.setObjectName("plotFrame")
@@ -105,11 +134,13 @@ class SingleMode(QDialog):
         self.load_data_button.clicked.connect(self.load_data)
         self.clear_data_button.clicked.connect(self.clear_data)
         self.save_plot_button.clicked.connect(self.save_plot)
+        self.save_settings_button.clicked.connect(self.save_settings)
         self.options_button.clicked.connect(self.open_options_dialog)
         self.select_curves_button.clicked.connect(self.open_select_curves_dialog)
         self.analyse_button.clicked.connect(self.open_analyse_dialog)
         self.back_button.clicked.connect(self.close_dialog)
         self.help_button.clicked.connect(self.open_help_dialog)
+        self.follow_checkbox.toggled.connect(self.toggle_follow)
 
     def update_marker_state(self, active, position=None):
         self.marker_active = active
@@ -143,18 +174,48 @@ class SingleMode(QDialog):
             options=options
         )
         if file_name:
-            try:
-                print(f"File loaded: {file_name}")
-                self.loaded_file = file_name
-                self.data = AKdatafile(file_name).genAKdict(1, 2)
+            # Parse the file in a background thread so the window keeps repainting
+            self.load_worker, self.load_thread = create_load_worker([file_name], self, prefetch=(0, 'Fraction'))
+            self.load_worker.fileLoaded.connect(self.data_loaded)
+            self.load_worker.fileFailed.connect(self.data_load_failed)
+            self.load_worker.finished.connect(self.loading_finished)
 
-                # Reopen the SelectCurvesDialog with the new data
-                self.open_select_curves_dialog()
+            self.load_progress = QProgressDialog(f"Loading '{os.path.basename(file_name)}'...", "Cancel", 0, 0, self)
+            self.load_progress.setWindowTitle("Load data")
+            self.load_progress.setMinimumDuration(500)
+            self.load_progress.canceled.connect(self.cancel_loading)
+            self.load_data_button.setEnabled(False)
 
-                # Update the plot with the new data
-                self.update_plot()
-            except Exception as e:
-                QMessageBox.critical(self, "Error Loading Data", f"An error occurred while loading '{os.path.basename(file_name)}'.  Please check that it has the correct format.")
+            self.load_thread.start()
+
+    def data_loaded(self, file_name, data):
+        print(f"File loaded: {file_name}")
+        self.loaded_file = file_name
+        self.data = data
+
+        try:
+            # Reopen the SelectCurvesDialog with the new data
+            self.open_select_curves_dialog()
+
+            # Update the plot with the new data
+            self.update_plot()
+        except Exception as e:
+            print(f"Error plotting {file_name}: {e}")
+            self.data_load_failed(file_name, str(e))
+
+    def data_load_failed(self, file_name, error):
+        print(f"Error loading {file_name}: {error}")
+        QMessageBox.critical(self, "Error Loading Data", f"An error occurred while loading '{os.path.basename(file_name)}'.  Please check that it has the correct format.")
+
+    def loading_finished(self, cancelled):
+        self.load_progress.close()
+        self.load_data_button.setEnabled(True)
+        self.load_worker = None
+        self.load_thread = None
+
+    def cancel_loading(self):
+        if self.load_worker is not None:
+            self.load_worker.cancel()
 
     def open_select_curves_dialog(self):
         if not self.is_data_loaded():
@@ -179,115 +240,119 @@ class SingleMode(QDialog):
         self.selected_curves.update(selected_curves)
 
         # Force an update of the plot with the new curve selections
-        self.update_plot()
+        self.redraw.request()
 
     def update_plot(self):
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-
-        self.fraction_labels = []
-        self.ax1 = ax
+        # Whatever was waiting to be drawn is part of this render
+        self.redraw.cancel()
 
-        handles = []
-        labels = []
-
-        # Plot UV curve separately with its own customization options
-        # if 'UV' in self.data:
-        keys = [x for x in self.data.keys()]
-        uv_options = self.selected_curves.get('UV', {
-            'linestyle': '-', 'linewidth': 1.5, 'color': 'black', 'ylabel': 'Absorbance (mAU)', 'label': 'UV'
-        })
-        curvekeys = list(self.data[keys[0]].keys())
-        x = np.array(self.data[keys[0]][curvekeys[0]])
-        y = np.array(self.data[keys[0]][curvekeys[1]])
-        
-        uv_line, = ax.plot(x, y, label=uv_options['label'], color=uv_options['color'], linestyle=uv_options['linestyle'], linewidth=uv_options['linewidth'])
-        ax.set_xlim(left=0, right=max(x))
-        ax.set_ylabel(uv_options['ylabel'])#, color=uv_options['color'])
-        # ax.tick_params(axis='y', labelcolor=uv_options['color'])
-        minorlocator=AutoMinorLocator(5) 
-        ax.xaxis.set_minor_locator(minorlocator)
-        handles.append(uv_line)
-        labels.append(uv_options['label'])
-
-        # Apply custom limits if set, else use default limits
-        if self.xmin is not None or self.xmax is not None:
-            ax.set_xlim(left=self.xmin, right=self.xmax)
-        else:
-            ax.set_xlim(left=0, right=max(x))
-
-        if self.ymin is not None or self.ymax is not None:
-            ax.set_ylim(bottom=self.ymin, top=self.ymax)
-
-        # Plot selected curves with customization options
-        self.y_axes = [ax]
-
-        for i, (curve, options) in enumerate(self.selected_curves.items()):
-            if curve != 'UV' and curve in self.data:
-                linestyle = options.get('linestyle', '-')
-                linewidth = options.get('linewidth', 1.5)
-                color = options.get('color', self.colors[i % len(self.colors)])
-                ylabel = options.get('ylabel', curve)
-                label = options.get('label', curve)
-
-                curvekeys = list(self.data[curve].keys())
-                x = np.array(self.data[curve][curvekeys[0]])
-                y = np.array(self.data[curve][curvekeys[1]])
-
-                if len(self.y_axes) == 1:
-                    new_ax = ax.twinx()
-                    self.y_axes.append(new_ax)
-                elif len(self.y_axes) == 2:
-                    new_ax = ax.twinx()
-                    new_ax.spines['right'].set_position(('outward', 25 * len(self.y_axes)))
-                    self.y_axes.append(new_ax)
-                elif len(self.y_axes) > 2:
-                    new_ax = ax.twinx()
-                    new_ax.spines['right'].set_position(('outward', 40 * len(self.y_axes)))
-                    self.y_axes.append(new_ax)                  
-
-                try:
-                    line, = new_ax.plot(x, y, label=label, color=color, linestyle=linestyle, linewidth=linewidth)
-                except Exception as e:
-                    print("Error plotting curve:", e)
-                new_ax.set_ylabel(ylabel)#, color=color)
-                # new_ax.tick_params(axis='y', labelcolor=color)
-
-                handles.append(line)
-                labels.append(label)
-
-        ax.set_xlabel('Volume (mL)')
-
-        if self.show_legend:
-            if self.legend_location == 'upper center':
-                ax.legend(loc='upper center', bbox_to_anchor=(0.5, 1.12), ncol=10, fontsize=8, handles=handles, labels=labels)
-            else:
-                ax.legend(loc='best', fontsize=8, handles=handles, labels=labels)
-
-        if self.show_fraction_labels:
-            self.add_fractions()
+        if self.show_fraction_labels and not has_fractions(self.data):
+            QMessageBox.warning(self, "Error", "Fraction data does not seem to be present.")
+            self.show_fraction_labels = False
+            if self.options_dialog:
+                self.options_dialog.add_fraction_labels_checkbox.setChecked(False)
 
-        if self.show_shaded_fractions:
-            self.add_shaded_regions()
+        # The renderer keeps the axes and lines and only changes what differs from the last call
+        render_single(self.renderer, self.data, self.plot_config(), marker=self.marker_position if self.marker_active else None)
+        self.ax1 = self.renderer.ax1
+        self.y_axes = self.renderer.y_axes
+        self.curve_lines = self.renderer.curve_lines
+        self.fraction_labels = self.renderer.fraction_labels
 
-        # Redraw the vertical marker line if it exists
         if self.marker_active and self.marker_position is not None:
-            self.ax1.axvline(self.marker_position, color='red', linestyle='--')
             if hasattr(self, 'analyse_dialog') and self.analyse_dialog:
                 self.analyse_dialog.update_y_values(self.marker_position)
 
-        plt.tight_layout()
-        self.canvas.draw()
+        self.canvas.draw_idle()
+
+    def plot_config(self):
+        # The current settings, in the form saved for and used by batch output
+        return single_config(
+            curves=self.selected_curves,
+            xlim=(self.xmin, self.xmax), ylim=(self.ymin, self.ymax),
+            legend=self.legend_location if self.show_legend else None,
+            fraction_labels=self.show_fraction_labels,
+            shaded_regions=self.shaded_regions if self.show_shaded_fractions else (),
+            figsize=tuple(self.figure.get_size_inches())
+        )
+
+    def marker_values(self, x_value):
+        # Values of the plotted curves at the marker, from an index built once per data and curve selection
+        curve_lines = self.renderer.curve_lines
+        key = (id(self.data), tuple(curve for curve, line in curve_lines))
+        if key != self.marker_index_key:
+            self.marker_index = CurveIndex([line.get_data() for curve, line in curve_lines])
+            self.marker_index_key = key
+        return zip([line.get_label() for curve, line in curve_lines], self.marker_index.values(x_value))
+
+    def toggle_follow(self, checked):
+        if not checked:
+            self.stop_follow()
+            return
+        if not self.is_data_loaded():
+            self.follow_checkbox.setChecked(False)
+            return
+
+        # The file is parsed once more and then re-read in a background thread
+        self.follow_worker, self.follow_thread = create_follow_worker(self.loaded_file, self)
+        self.follow_worker.updated.connect(self.follow_updated)
+        self.follow_worker.failed.connect(self.follow_failed)
+        self.followRequested.connect(self.follow_worker.update)
+        self.follow_started = False
+        self.follow_file()
+        self.follow_timer.start()
+
+    def follow_file(self):
+        # A read that takes longer than the interval is not queued up again
+        if self.follow_worker is None or self.follow_busy:
+            return
+        self.follow_busy = True
+        self.followRequested.emit()
+
+    def follow_updated(self, data):
+        # Results of a worker that was stopped meanwhile are dropped
+        if self.sender() is not self.follow_worker:
+            return
+        self.follow_busy = False
+        self.follow_started = True
+        if data is None:
+            return
+
+        # The renderer puts the new data on the existing lines
+        self.data = data
+        self.update_plot()
+
+    def follow_failed(self, error):
+        if self.sender() is not self.follow_worker:
+            return
+        self.follow_busy = False
+        print(f"Error following {self.loaded_file}: {error}")
+        if not self.follow_started:
+            QMessageBox.critical(self, "Error Following File", f"An error occurred while reading '{os.path.basename(self.loaded_file)}'.")
+            self.follow_checkbox.setChecked(False)
+
+    def stop_follow(self):
+        self.follow_timer.stop()
+        if self.follow_thread is not None:
+            self.followRequested.disconnect(self.follow_worker.update)
+            # A read in progress is finished before the thread goes
+            self.follow_thread.quit()
+            self.follow_thread.wait()
+            self.follow_worker = None
+            self.follow_thread = None
+        self.follow_busy = False
 
     def set_legend_location(self, location):
         self.legend_location = location
-        self.update_plot()
+        self.redraw.request()
 
     def clear_data(self):
         if self.options_dialog:
             self.options_dialog.close()
 
         if self.loaded_file:
+            self.follow_checkbox.setChecked(False)
+
             # Reset plot-related variables to their defaults
             self.loaded_file = None
             self.data = None
@@ -304,7 +369,8 @@ class SingleMode(QDialog):
             self.ymax = None
 
             # Clear the plot figure
-            self.figure.clear()
+            self.redraw.cancel()
+            self.renderer.reset()
 
             # Close dialogs if they are open
             if self.select_curves_dialog is not None:
@@ -318,49 +384,6 @@ class SingleMode(QDialog):
 
             print("All data and settings cleared.")
 
-    def add_fractions(self, stript=True, fontsize=6, labheight=0.02):
-        flabx = []
-        try:
-            f = self.data['Fraction']['ml']
-            flab = self.data['Fraction']['Fraction']
-        except KeyError:
-            QMessageBox.warning(self, "Error", "Fraction data does not seem to be present.")
-            # raise KeyError('Fraction data does not seem to be present')
-
-            self.show_fraction_labels = False
-            self.options_dialog.add_fraction_labels_checkbox.setChecked(False) 
-            return
-        
-        for i in range(len(flab) - 1):
-            flabx.append((f[i] + f[i+1]) / 2)
-
-        if stript:
-            flab = [x.strip("T\"") for x in flab]
-
-        x_min, x_max = self.ax1.get_xlim()
-        y_min, y_max = self.ax1.get_ylim()
-
-        line_height = y_min + (y_max - y_min) * 0.05
-        label_height = y_min + (y_max - y_min) * labheight
-
-        for i in range(len(f)):
-            if flab[i] == "Waste" or not (x_min <= f[i] <= x_max):
-                continue
-
-            start_line = self.ax1.axvline(x=f[i], ymin=0, ymax=(line_height - y_min) / (y_max - y_min), color='red', ls=':')
-            self.fraction_labels.append(start_line)
-
-            if i < len(f) - 1:
-                end_line = self.ax1.axvline(x=f[i+1], ymin=0, ymax=(line_height - y_min) / (y_max - y_min), color='red', ls=':')
-                self.fraction_labels.append(end_line)
-
-        for i in range(len(flabx)):
-            if flab[i] == "Waste" or not (x_min <= flabx[i] <= x_max):
-                continue
-
-            label = self.ax1.text(flabx[i], label_height, flab[i], fontsize=fontsize, ha='center', va='center')
-            self.fraction_labels.append(label)
-
     def save_plot(self):
         if not self.is_data_loaded():
             return
@@ -388,7 +411,12 @@ class SingleMode(QDialog):
                 file_name += extension
 
             try:
-                self.figure.savefig(file_name)
+                # Edits still waiting to be drawn belong in the saved plot
+                self.redraw.flush()
+
+                # The plot on screen is decimated, the saved file gets every point
+                with full_resolution(self.figure):
+                    self.figure.savefig(file_name)
                 QMessageBox.information(self, "Save Plot", "Plot saved successfully!")
             except PermissionError:
                 QMessageBox.critical(self, "Save Error", f"Permission denied: Cannot save the file '{file_name}'.")
@@ -397,7 +425,31 @@ class SingleMode(QDialog):
             except Exception as e:
                 QMessageBox.critical(self, "Save Error", f"An unexpected error occurred: {str(e)}.")
 
+    def save_settings(self):
+        if not self.is_data_loaded():
+            return
+
+        file_name, _ = QFileDialog.getSaveFileName(self, "Save Plot Settings", "", "Plot Settings (*.json);;All Files (*)")
+        if not file_name:
+            return
+        if not file_name.lower().endswith('.json'):
+            file_name += '.json'
+
+        try:
+            # Read back by the batch command line, python -m chromaplot.batch --config
+            save_config(self.plot_config(), file_name)
+            QMessageBox.information(self, "Save Settings", "Plot settings saved successfully!")
+        except OSError as e:
+            QMessageBox.critical(self, "Save Error", f"An error occurred while saving the file '{file_name}': {str(e)}.")
+
     def close_dialog(self):
+        self.cancel_loading()
+        if self.load_thread is not None:
+            # A file being parsed is finished first, its result is dropped
+            self.load_thread.quit()
+            self.load_thread.wait()
+        self.redraw.cancel()
+        self.follow_checkbox.setChecked(False)
         if self.select_curves_dialog:
             self.select_curves_dialog.close()
         if self.options_dialog:
@@ -433,119 +485,71 @@ class SingleMode(QDialog):
             return        
         self.xmin = xmin
         self.xmax = xmax
-        self.update_plot()
+        self.redraw.request()
 
     def set_y_limits(self, ymin, ymax):
         if not self.is_data_loaded():
             return        
         self.ymin = ymin
         self.ymax = ymax
-        self.update_plot()
+        self.redraw.request()
 
     def reset_x_limits(self):
         if not self.is_data_loaded():
             return        
         self.xmin = None
         self.xmax = None
-        self.update_plot()
+        self.redraw.request()
 
     def reset_y_limits(self):
         if not self.is_data_loaded():
             return
         self.ymin = None
         self.ymax = None
-        self.update_plot()
+        self.redraw.request()
 
     def set_legend_visibility(self, visible):
         if not self.is_data_loaded():
             return        
         self.show_legend = visible
-        self.update_plot()
+        self.redraw.request()
 
     def set_fraction_labels_visibility(self, visible):
         if not self.is_data_loaded():
             return        
         self.show_fraction_labels = visible
-        self.update_plot()
+        self.redraw.request()
 
     def set_shaded_fractions_visibility(self, start_value, stop_value, mode, color, alpha):
         if not self.is_data_loaded():
             return
 
         if mode == 'Fractions':
+            # The fraction numbers are kept and turned into volumes when drawn, check that they exist
             try:
-                # Retrieve fraction data
-                fractions = self.data['Fraction']['Fraction']
-                volumes = self.data['Fraction']['ml']
-            except KeyError:
-                QMessageBox.warning(self, "Error", "Fraction data does not seem to be present.")
-                return
-
-            # Clean and convert fraction numbers to integers
-            fractions = [int(x.strip("T\"")) for x in fractions if x.strip("T\"").isdigit()]
-
-            # Check if specified fractions exist in the data
-            if int(start_value) not in fractions or int(stop_value) not in fractions:
-                QMessageBox.warning(self, "Error", "Specified fractions are not in the data.")
+                fraction_volumes(self.data, start_value, stop_value)
+            except ValueError as e:
+                QMessageBox.warning(self, "Error", str(e))
                 return
 
-            # Get the corresponding volume ranges
-            start_index = fractions.index(int(start_value))
-            stop_index = fractions.index(int(stop_value))
-
-            start_vol = volumes[start_index]
-
-            if stop_index + 1 < len(volumes):
-                stop_vol = volumes[stop_index + 1]
-            else:
-                stop_vol = volumes[stop_index]
-
-            # Store the actual volumes for shading
-            self.shaded_regions.append((start_vol, stop_vol, color, alpha))
-        else:
-            self.shaded_regions.append((start_value, stop_value, color, alpha))
-
+        self.shaded_regions.append((start_value, stop_value, mode, color, alpha))
         self.show_shaded_fractions = True
 
         # Update the plot
-        self.update_plot()
-
-    def add_shaded_regions(self):
-        if not self.is_data_loaded():
-            return        
-        if not self.shaded_regions:
-            return
-
-        x_lim = self.ax1.get_xlim()
-        y_lim = self.ax1.get_ylim()
-
-        for start_vol, stop_vol, color, alpha in self.shaded_regions:
-            # Shade the area under the curve between the start and stop volumes
-            xdata, ydata = self.ax1.lines[0].get_data() 
-            mask = (xdata >= start_vol) & (xdata <= stop_vol)
-
-            # Determine the y2 baseline, which could be the minimum y limit or a specified value
-            y_min = y_lim[0]  # Use the saved minimum y-limit of the plot
-
-            # Use fill_between with y2 set to the minimum y-limit
-            self.ax1.fill_between(xdata[mask], ydata[mask], y2=y_min, color=color, alpha=alpha)
-
-        # Restore the axis limits to what they were before shading
-        self.ax1.set_xlim(x_lim)
-        self.ax1.set_ylim(y_lim)
+        self.redraw.request()
 
     def undo_shade(self):
         if not self.is_data_loaded():
             return        
         if self.shaded_regions:
             self.shaded_regions.pop()
-            self.update_plot()
+            self.redraw.request()
 
     def clear_shaded_regions(self):
         if not self.is_data_loaded():
             return        
         self.shaded_regions.clear()
-        self.update_plot()
+        self.redraw.request()
 
     def open_analyse_dialog(self):
         if not self.is_data_loaded():
@@ -1054,6 +1058,7 @@ class AnalyseDialog(QDialog):
 
         self.parent = parent  # Correctly store the reference to the parent
         self.marker_line = None  # To store the vertical marker line
+        self.marker = None
 
         # Create layout
         self.layout = QVBoxLayout()
@@ -1125,6 +1130,7 @@ class AnalyseDialog(QDialog):
 
         # Add the vertical marker line to the plot
         self.marker_line = ax1.axvline(initial_position, color='red', linestyle='--')
+        self.marker = BlittedMarker(self.parent.canvas, self.marker_line)
 
         # Update the y-values for the initial position
         self.update_y_values(initial_position)
@@ -1134,43 +1140,22 @@ class AnalyseDialog(QDialog):
 
     def remove_vertical_marker(self):
         if self.marker_line:
-            self.marker_line.remove()
+            self.marker.remove()
+            self.marker = None
             self.marker_line = None
             self.y_values_display.clear()
             self.parent.canvas.draw()
 
-    # This version works properly but is slow because the whole plot 
-    # needs to be updated as the marker is moved
-    # def update_marker_position(self, value):
-    #     if self.marker_line:
-    #         self.marker_line.set_xdata([value / 100, value / 100])
-    #         self.update_y_values(value / 100)
-    #         self.parent.update_marker_state(True, value / 100)  # Update the parent's marker state with the new position
-    #         self.parent.canvas.draw()
-
-    # This version is quicker, but messes up when other aspects of the plot is changed
-    # Marker needs to be turned on and off again
     def update_marker_position(self, value):
         if self.marker_line:
             x_value = value / 100.0
-            # Update the marker line's position without redrawing the entire canvas
-            self.marker_line.set_xdata([x_value])
+            # Only the marker is redrawn, on top of the background kept from the last full draw
+            self.marker.move(x_value)
             self.update_y_values(x_value)
-            # Only update the area where the marker is drawn instead of the entire plot
-            self.parent.canvas.draw_idle()
 
     def update_y_values(self, x_value):
-        y_values = {}
-
-        # Iterate over each axis in the parent plot
-        for ax in self.parent.y_axes:
-            for curve in ax.lines:
-                label = curve.get_label()
-                # Filter out labels that start with an underscore
-                if not label.startswith('_'):
-                    x_data, y_data = curve.get_data()
-                    y_value = np.interp(x_value, x_data, y_data)
-                    y_values[label] = y_value
+        # Filter out labels that start with an underscore
+        y_values = {label: y for label, y in self.parent.marker_values(x_value) if not label.startswith('_')}
 
         y_values_str = f"Marker Position: {x_value:.2f} mL\n"  # Show the current volume at the top
         y_values_str += "\n".join([f"{label}: {y:.2f} mAU" for label, y in y_values.items()])
@@ -4,35 +4,134 @@ Authors: Billy Hobbs and Felipe Ossa
 © 2024 Billy Hobbs. All rights reserved.
 '''
 
+import json
+import os
 import subprocess
+import tempfile
+import threading
+import time
 import webbrowser
-import requests
 import sys
+from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox
 
 GITHUB_API_URL = "https://api.github.com/repos/beh22/ChromaPlot/releases/latest"
 
-def check_for_updates(CURRENT_VERSION):
+# Result of the last check, together with the opt-out setting
+STATE_FILE = os.path.join(os.path.expanduser('~'), '.chromaplot', 'update_check.json')
+
+# Connect and read timeouts in seconds, and how long a result is reused before asking again
+TIMEOUT = (3.0, 5.0)
+CHECK_INTERVAL = 24 * 3600
+
+
+def load_state(path=STATE_FILE):
     try:
-        response = requests.get(GITHUB_API_URL)
-        response.raise_for_status()
-        latest_release = response.json()
+        with open(path, 'r', encoding='UTF-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
 
-        latest_version = latest_release["tag_name"]
 
-        if latest_version > CURRENT_VERSION:
-            return latest_release
-        return None
+def save_state(state, path=STATE_FILE):
+    # Written to a temporary name and moved into place, several instances may start at once
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='UTF-8') as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError as e:
+        print(f"Error saving update check state: {e}")
+
+
+def updates_enabled(path=STATE_FILE):
+    """Whether to check for updates at startup. Turned off from the About
+    dialog, or for all users with CHROMAPLOT_UPDATE_CHECK=0."""
+    if os.environ.get('CHROMAPLOT_UPDATE_CHECK', '1').strip().lower() in ('0', 'false', 'no', 'off'):
+        return False
+    return load_state(path).get('enabled', True)
+
+
+def set_updates_enabled(enabled, path=STATE_FILE):
+    state = load_state(path)
+    state['enabled'] = bool(enabled)
+    save_state(state, path)
+
+
+def newer_release(release, CURRENT_VERSION):
+    if release and release.get("tag_name", "") > CURRENT_VERSION:
+        return release
+    return None
 
+
+def check_for_updates(CURRENT_VERSION, timeout=TIMEOUT, path=STATE_FILE):
+    """Returns the latest release if it is newer than CURRENT_VERSION.
+
+    A result less than CHECK_INTERVAL old is taken from the state file
+    without going to the network. Otherwise GitHub is asked with a strict
+    timeout and the answer is stored, a failed check is stored too so an
+    offline machine only tries once per interval. Blocks for up to the
+    timeout, from the GUI it is run by an UpdateCheck, made with
+    create_update_check.
+    """
+    state = load_state(path)
+    checked = state.get('checked', 0)
+    if state.get('version') == CURRENT_VERSION and 0 <= time.time() - checked < CHECK_INTERVAL:
+        return newer_release(state.get('latest'), CURRENT_VERSION)
+
+    latest_release = None
+    try:
+        # Imported here, requests takes a while to import and is only needed for this
+        import requests
+        response = requests.get(GITHUB_API_URL, timeout=timeout)
+        response.raise_for_status()
+        release = response.json()
+        latest_release = {"tag_name": release["tag_name"], "html_url": release["html_url"]}
     except Exception as e:
         print(f"Error checking for updates: {e}")
+
+    state = load_state(path)
+    state.update({'checked': time.time(), 'version': CURRENT_VERSION, 'latest': latest_release})
+    save_state(state, path)
+    return newer_release(latest_release, CURRENT_VERSION)
+
+
+class UpdateCheck(QObject):
+    """Runs check_for_updates in the background and reports a newer release
+    through updateAvailable, which is delivered in the GUI thread."""
+    updateAvailable = pyqtSignal(object)
+
+    def __init__(self, CURRENT_VERSION, parent=None):
+        super().__init__(parent)
+        self.current_version = CURRENT_VERSION
+        # A daemon thread, so a check still waiting on the network never holds up quitting
+        self.thread = threading.Thread(target=self.run, name="update-check", daemon=True)
+
+    def run(self):
+        latest_release = check_for_updates(self.current_version)
+        if latest_release:
+            self.updateAvailable.emit(latest_release)
+
+
+def create_update_check(CURRENT_VERSION, parent=None):
+    """Creates an UpdateCheck unless checking has been turned off, None if
+    it has. Connect to its signal and then call update_check.thread.start()."""
+    if not updates_enabled():
         return None
+    return UpdateCheck(CURRENT_VERSION, parent)
 
-def prompt_for_update(latest_release):
+def prompt_for_update(latest_release, parent=None):
     download_url = latest_release["html_url"]
 
     reply = QMessageBox.question(
-        None, "Update Available",
+        parent, "Update Available",
         f"A new version {latest_release['tag_name']} is available.  Would you like to update?",
         QMessageBox.Yes | QMessageBox.No
     )
@@ -50,5 +149,3 @@ def prompt_for_update(latest_release):
                     QMessageBox.critical(None, "Error", "Failed to open the web browser. Please visit the GitHub page manually.")
             else:
                 QMessageBox.critical(None, "Error", "Failed to open the web browser. Please visit the GitHub page manually.")                  
-        
-        sys.exit()
\ No newline at end of file
@@ -0,0 +1,262 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from chromaplot.batch import FORMATS, new_figure, save_figure, output_base
+from chromaplot.loader import load_file
+from chromaplot.rendering import SingleRenderer
+from chromaplot.plot_config import single_config, load_config, render_single
+
+EXTENSIONS = ('.txt', '.asc')
+INDEX_NAME = 'chromaplot-index.json'
+
+
+def render_file(file_name, config, output_dir, formats=('pdf',), thumbnail_width=240):
+    """Renders one data file with a Single Mode configuration to output_dir,
+    as full figures in formats and as a PNG thumbnail thumbnail_width pixels
+    wide. Returns the files written."""
+    data = load_file(file_name, prefetch=(0, 'Fraction'))
+    figure = new_figure(config)
+    render_single(SingleRenderer(figure), data, config)
+    base_name = output_base(file_name, output_dir)
+    written = save_figure(figure, base_name, formats)
+    if thumbnail_width:
+        written += save_figure(figure, base_name + '.thumb', ['png'], dpi=thumbnail_width / config['figsize'][0])
+    return written
+
+
+class ProcessedIndex:
+    """Files already rendered, stored as JSON so a restarted watcher skips them.
+
+    Each entry records the size and mtime of the file when it was processed,
+    together with the outcome. A file is processed again when either
+    changes, failed files included, as a failure is often an export that was
+    still being written.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        try:
+            with open(file_name, 'r', encoding='UTF-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_current(self, path, stat):
+        entry = self.entries.get(path)
+        return entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def record(self, path, stat, entry):
+        self.entries[path] = dict(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns, processed=time.time())
+        self.save()
+
+    def save(self):
+        # Written to a temporary name and moved into place, so a crash never leaves half an index
+        directory = os.path.dirname(os.path.abspath(self.file_name))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='UTF-8') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.file_name)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+class FolderWatcher:
+    """Renders new and changed exports dropped into a folder.
+
+    The folder is scanned every interval seconds, and straight away when the
+    optional watchdog package reports a change, which uses inotify and its
+    equivalents. A file is queued once its size and mtime have not changed
+    for settle seconds, so exports still being written are left alone, and
+    files in the index with the same size and mtime are skipped. The queue is
+    worked through one file at a time, starting at most rate files a minute,
+    so a burst of exports is spread out instead of taking over the machine.
+    """
+
+    def __init__(self, folder, config, output_dir, formats=('pdf',), thumbnail_width=240,
+                 interval=5.0, settle=2.0, rate=12, index_file=None):
+        self.folder = os.path.abspath(folder)
+        self.config = config
+        self.output_dir = output_dir
+        self.formats = formats
+        self.thumbnail_width = thumbnail_width
+        self.interval = interval
+        self.settle = settle
+        self.min_gap = 60.0 / rate if rate else 0.0
+        self.index = ProcessedIndex(index_file or os.path.join(output_dir, INDEX_NAME))
+
+        self.pending = {}
+        self.queue = OrderedDict()
+        self.last_start = None
+        self.wake = threading.Event()
+        self.stop = threading.Event()
+        self.observer = None
+
+    def start_observer(self):
+        """Starts a watchdog observer if the package is installed, returns
+        False when only polling is available."""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return False
+
+        wake = self.wake
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                wake.set()
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), self.folder, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+        return True
+
+    def scan(self):
+        """Queues the exports whose size and mtime have settled and that are
+        not in the index with that size and mtime."""
+        now = time.monotonic()
+        seen = set()
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(EXTENSIONS):
+                    continue
+                path = entry.path
+                seen.add(path)
+                stat = entry.stat()
+                if path in self.queue or self.index.is_current(path, stat):
+                    self.pending.pop(path, None)
+                    continue
+
+                key = (stat.st_size, stat.st_mtime_ns)
+                last_key, since = self.pending.get(path, (None, now))
+                if key != last_key:
+                    self.pending[path] = (key, now)
+                elif now - since >= self.settle:
+                    del self.pending[path]
+                    self.queue[path] = None
+
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+
+    def process_next(self):
+        """Renders the first queued file if the rate limit allows, returns
+        the seconds to wait before the next one may start."""
+        if not self.queue:
+            return None
+        if self.last_start is not None:
+            wait = self.last_start + self.min_gap - time.monotonic()
+            if wait > 0:
+                return wait
+
+        path, _ = self.queue.popitem(last=False)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Removed again before its turn
+            return 0.0
+        self.last_start = time.monotonic()
+
+        entry = {'status': 'ok', 'outputs': [], 'error': None}
+        try:
+            entry['outputs'] = render_file(path, self.config, self.output_dir, self.formats, self.thumbnail_width)
+            print(f"Rendered {path}", flush=True)
+        except Exception as e:
+            entry['status'] = 'failed'
+            entry['error'] = f"{type(e).__name__}: {e}"
+            print(f"Error rendering {path}: {entry['error']}", file=sys.stderr, flush=True)
+        entry['seconds'] = time.monotonic() - self.last_start
+
+        # Stored with the size and mtime seen before rendering, a file changed meanwhile is done again
+        self.index.record(path, stat, entry)
+        return 0.0 if self.queue else None
+
+    def run(self):
+        """Watches the folder until stop is set."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        watching = self.start_observer()
+        print(f"Watching {self.folder} ({'file system events' if watching else 'polling'} "
+              f"every {self.interval:g} s), writing to {self.output_dir}", flush=True)
+
+        next_scan = 0.0
+        try:
+            while not self.stop.is_set():
+                now = time.monotonic()
+                if now >= next_scan or self.wake.is_set():
+                    self.wake.clear()
+                    self.scan()
+                    next_scan = now + self.interval
+                wait = self.process_next()
+
+                # Settling files need another look even if no event arrives
+                timeout = next_scan - time.monotonic()
+                if self.pending:
+                    timeout = min(timeout, self.settle)
+                if wait is not None:
+                    timeout = min(timeout, wait)
+                if timeout > 0:
+                    self.wake.wait(timeout)
+        finally:
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m chromaplot.watch',
+        description="Render every Akta export dropped into a folder, as it arrives."
+    )
+    parser.add_argument('folder', help="folder the exports are written to")
+    parser.add_argument('-c', '--config', help="Single Mode plot settings saved with 'Save settings'")
+    parser.add_argument('-o', '--output', help="output directory (default: a ChromaPlot folder inside the watched folder)")
+    parser.add_argument('-f', '--format', action='append', choices=FORMATS,
+                        help="file format of the full figures, may be given more than once (default: pdf)")
+    parser.add_argument('--thumbnail-width', type=int, default=240, help="width of the PNG thumbnails in pixels, 0 for none")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between scans of the folder (default: 5)")
+    parser.add_argument('--settle', type=float, default=2.0, help="seconds a file must stay unchanged before it is rendered (default: 2)")
+    parser.add_argument('--rate', type=float, default=12, help="most files rendered per minute, 0 for no limit (default: 12)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    try:
+        config = load_config(args.config) if args.config else single_config()
+    except (OSError, ValueError) as e:
+        print(f"Error reading settings {args.config}: {e}", file=sys.stderr)
+        return 2
+    if config['mode'] != 'single':
+        print(f"Settings in {args.config} are for {config['mode']} mode, the watcher needs Single Mode settings", file=sys.stderr)
+        return 2
+
+    watcher = FolderWatcher(
+        args.folder, config, args.output or os.path.join(args.folder, 'ChromaPlot'),
+        formats=args.format or ['pdf'], thumbnail_width=args.thumbnail_width,
+        interval=args.interval, settle=args.settle, rate=args.rate
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
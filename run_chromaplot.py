@@ -4,7 +4,11 @@ Authors: Billy Hobbs and Felipe Ossa
 © 2024 Billy Hobbs. All rights reserved.
 '''
 
+from multiprocessing import freeze_support
+
 from chromaplot.main import main
 
 if __name__ == "__main__":
+    # Needed for the worker processes used to load files in packaged builds
+    freeze_support()
     main()
\ No newline at end of file
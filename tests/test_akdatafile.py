@@ -0,0 +1,54 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import pytest
+
+from chromaplot.AKdatafile import AKdatafile
+
+HEADER = ['Run\t\t\t', 'UV\t\tCond\t', 'ml\tmAU\tml\tmS/cm']
+ROWS = [f"{k / 10}\t{k % 13}\t{k / 10}\t{k % 7}" for k in range(100)]
+
+
+def write(path, lines, encoding='UTF-16'):
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        f.write('\r\n'.join(lines) + ('\r\n' if lines else ''))
+    return str(path)
+
+
+@pytest.mark.parametrize('lines', [[], HEADER[:1], HEADER[:2]])
+def test_lazy_short_file(tmp_path, lines):
+    file_name = write(tmp_path / 'short.txt', lines)
+    with pytest.raises(ValueError, match='header lines of .*short.txt.* are missing'):
+        AKdatafile(file_name).lazyAKdict(1, 2)
+
+
+def test_lazy_header_only(tmp_path):
+    data = AKdatafile(write(tmp_path / 'empty.txt', HEADER)).lazyAKdict(1, 2, prefetch=(0,))
+    assert list(data) == ['UV', 'Cond']
+    assert len(data.curve('UV')[0]) == 0
+
+
+@pytest.mark.parametrize('lines', [[], HEADER[:1], HEADER[:2]])
+def test_stream_short_file(tmp_path, lines):
+    file_name = write(tmp_path / 'short.txt', lines)
+    with pytest.raises(ValueError, match='header lines of .*short.txt.* are missing'):
+        AKdatafile(file_name).genAKdict(1, 2)
+
+
+def test_follow_waits_for_header(tmp_path):
+    path = tmp_path / 'run.txt'
+    write(path, HEADER[:1])
+    follower = AKdatafile(str(path))
+    assert follower.followAKdict(1, 2) == {}
+    assert follower.updateAKdict() == 0
+
+    write(path, HEADER + ROWS[:10])
+    assert follower.updateAKdict() == 10
+    assert list(follower.odict) == ['UV', 'Cond']
+
+    write(path, HEADER + ROWS)
+    assert follower.updateAKdict() == 90
+    assert list(follower.odict['UV']['mAU']) == [k % 13 for k in range(100)]
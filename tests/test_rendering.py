@@ -0,0 +1,45 @@
+'''
+ChromaPlot Version 0.1.1
+Authors: Billy Hobbs and Felipe Ossa
+© 2024 Billy Hobbs. All rights reserved.
+'''
+
+import os
+
+from matplotlib.backend_bases import ResizeEvent
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from chromaplot.AKdatafile import AKdatafile
+from chromaplot.plot_config import single_config, render_single
+from chromaplot.rendering import SingleRenderer
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_datasets',
+                       '240411_Hsc70FL_T204A_strep_superdex200_10_300_900uL_38mg.txt')
+
+
+def resize(figure, width):
+    # What the Qt canvas does when its widget is resized
+    figure.set_size_inches(width, figure.get_size_inches()[1])
+    ResizeEvent('resize_event', figure.canvas)._process()
+
+
+def label_count(renderer):
+    return sum(artist in renderer.ax1.texts for artist in renderer.fraction_labels)
+
+
+def test_fraction_labels_follow_resize():
+    data = AKdatafile(EXAMPLE).lazyAKdict(1, 2)
+    config = single_config(fraction_labels=True, figsize=(14, 3.5))
+    figure = Figure(figsize=tuple(config['figsize']))
+    FigureCanvasAgg(figure)
+    renderer = SingleRenderer(figure)
+    render_single(renderer, data, config)
+    wide = label_count(renderer)
+
+    resize(figure, 4)
+    narrow = label_count(renderer)
+    assert 0 < narrow < wide
+
+    resize(figure, 14)
+    assert label_count(renderer) == wide